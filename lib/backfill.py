@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# lib/backfill.py
+"""
+Parallel backfill of vaccine schedules for every child in the registry.
+
+Children are split into fixed id ranges. A pool of worker processes
+plans each range's missing doses (see scheduling.plan_child) from a
+read-only view of the database, and the parent process is the only
+writer: it saves each planned range in one transaction together with a
+checkpoint row, so an interrupted run picks up where it stopped.
+
+Usage: python -m lib.backfill [--workers N] [--chunk-size N] [--run NAME] [--restart]
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+
+from lib import db
+from lib.db import connection, unit_of_work
+from lib.models.child import Child
+from lib.models.child_vaccine import ChildVaccine
+from lib.models.vaccine import Vaccine
+from lib.scheduling import plan_child, save_plans
+from lib.templates import DEFAULT_LANGUAGE
+
+CHUNK_SIZE = 2000
+
+_vaccines = None
+
+
+def _init_worker(path, date_storage, vaccines):
+    global _vaccines
+    db.configure(path=path, date_storage=date_storage)
+    _vaccines = vaccines
+
+
+def plan_range(low_id, high_id, today):
+    """Worker: plan the missing doses of children with low_id < id <= high_id."""
+    children = Child.find_by_id_range(low_id, high_id)
+    history = ChildVaccine.find_dose_dates_by_child_range(low_id, high_id)
+    languages = Child.find_languages_by_id_range(low_id, high_id)
+    plans = []
+    for child in children:
+        plans.extend(plan_child(child, _vaccines, history.get(child.id, {}), today,
+                                languages.get(child.id, DEFAULT_LANGUAGE)))
+    return low_id, high_id, plans
+
+
+def _still_valid(plans, today):
+    # A run can cross midnight between planning and writing
+    for child_id, vaccine_id, scheduled_date, reminder_date, message in plans:
+        if scheduled_date < today:
+            continue
+        if reminder_date is not None and reminder_date < today:
+            reminder_date = message = None
+        yield child_id, vaccine_id, scheduled_date, reminder_date, message
+
+
+def save_range(run, low_id, high_id, plans):
+    """
+    Writer: save one planned range and its checkpoint atomically, skipping
+    doses scheduled since the range was planned. Returns (schedules, reminders).
+    """
+    with unit_of_work() as conn:
+        scheduled = ChildVaccine.find_vaccine_ids_by_child_range(low_id, high_id)
+        plans = [
+            plan for plan in _still_valid(plans, date.today())
+            if plan[1] not in scheduled.get(plan[0], ())
+        ]
+        schedules = len(save_plans(plans))
+        reminders = sum(1 for plan in plans if plan[3] is not None)
+        conn.execute("""
+            INSERT INTO backfill_checkpoints (run, low_id, high_id, schedules, reminders)
+            VALUES (?, ?, ?, ?, ?)
+        """, (run, low_id, high_id, schedules, reminders))
+    return schedules, reminders
+
+
+def pending_ranges(run, chunk_size=CHUNK_SIZE, restart=False):
+    """Id ranges (low_id, high_id] of `run` that have no checkpoint yet."""
+    with connection() as conn:
+        if restart:
+            conn.execute("DELETE FROM backfill_checkpoints WHERE run = ?", (run,))
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM children").fetchone()[0]
+        cursor = conn.execute("SELECT low_id FROM backfill_checkpoints WHERE run = ?", (run,))
+        done = {row[0] for row in cursor.fetchall()}
+    return [
+        (low_id, low_id + chunk_size)
+        for low_id in range(0, max_id, chunk_size)
+        if low_id not in done
+    ]
+
+
+def run_backfill(run=None, workers=None, chunk_size=CHUNK_SIZE, restart=False, progress=None):
+    """
+    Schedule every child's missing doses using `workers` processes (default:
+    one per CPU). Ranges already checkpointed under the same `run` name
+    (default: one run per day) are skipped. `progress(low_id, high_id,
+    schedules, reminders)` is called after each range is saved. Returns
+    the totals as (schedules, reminders).
+    """
+    run = run or f"backfill-{date.today().isoformat()}"
+    workers = workers or os.cpu_count() or 1
+    today = date.today()
+    vaccines = Vaccine.get_all()
+    ranges = pending_ranges(run, chunk_size, restart)
+    ranges.reverse()
+    total_schedules = total_reminders = 0
+
+    # spawn: workers must not inherit the parent's open SQLite connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(db.DB_PATH, db.DATE_STORAGE, vaccines)) as pool:
+        pending = set()
+        while ranges or pending:
+            # Keep a bounded number of planned ranges in flight so memory stays flat
+            while ranges and len(pending) < workers * 2:
+                low_id, high_id = ranges.pop()
+                pending.add(pool.submit(plan_range, low_id, high_id, today))
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                low_id, high_id, plans = future.result()
+                schedules, reminders = save_range(run, low_id, high_id, plans)
+                total_schedules += schedules
+                total_reminders += reminders
+                if progress is not None:
+                    progress(low_id, high_id, schedules, reminders)
+    return total_schedules, total_reminders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill vaccine schedules for every child.")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="children per id range")
+    parser.add_argument("--run", help="checkpoint name to resume (default: today's run)")
+    parser.add_argument("--restart", action="store_true", help="discard this run's checkpoints first")
+    args = parser.parse_args()
+
+    def report(low_id, high_id, schedules, reminders):
+        print(f"Children {low_id + 1}-{high_id}: {schedules} schedules, {reminders} reminders")
+
+    schedules, reminders = run_backfill(args.run, args.workers, args.chunk_size, args.restart, report)
+    print(f"Backfill complete: {schedules} schedules and {reminders} reminders created")
+
+
+if __name__ == "__main__":
+    main()
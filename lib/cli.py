@@ -4,17 +4,24 @@ from .helpers import (
     delete_child_profile, view_vaccine_schedule, mark_vaccine_complete,
     view_all_vaccines, view_reminders, check_overdue_vaccines, exit_program
 )
-from .models.user import User
-from .models.child import Child
-from .models.vaccine import Vaccine
-from .models.child_vaccine import ChildVaccine
-from .models.reminder import Reminder
+from . import models
+from .sweeper import sweep_overdue
+from .templates import LANGUAGES, language_name
 from datetime import datetime, date, timedelta
 import os
+import sqlite3
 
 def main():
     """Main application loop"""
     current_user = None
+    # Bring 'overdue' statuses up to date before any screen groups by them.
+    # If a backfill or the reminder job holds the write lock, skip it: that
+    # job sweeps too
+    try:
+        sweep_overdue()
+    except sqlite3.OperationalError as e:
+        if "locked" not in str(e):
+            raise
     
     while True:
         if current_user is None:
@@ -190,7 +197,7 @@ def view_health_records(user):
     print(" HEALTH RECORDS OVERVIEW")
     print("-" * 40)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found. Add a child profile first.")
@@ -203,7 +210,7 @@ def view_health_records(user):
         print(f"   Gender: {child.gender.capitalize()}")
         
         # Vaccine summary
-        child_vaccines = ChildVaccine.find_by_child_id(child.id)
+        child_vaccines = models.ChildVaccine.find_by_child_id(child.id)
         total_vaccines = len(child_vaccines)
         completed_vaccines = len([cv for cv in child_vaccines if cv.status == 'completed'])
         overdue_vaccines = len([cv for cv in child_vaccines if cv.status == 'overdue'])
@@ -249,7 +256,7 @@ def manage_account(user):
 
 def select_child_for_schedule(user):
     """Select a child to view vaccine schedule"""
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found. Add a child profile first.")
@@ -271,7 +278,7 @@ def select_child_for_schedule(user):
 
 def select_child_for_completion(user):
     """Select a child to mark vaccine complete"""
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found. Add a child profile first.")
@@ -293,7 +300,7 @@ def select_child_for_completion(user):
 
 def schedule_vaccine_for_child(user):
     """Allow user to schedule a vaccine for a selected child and show educational info."""
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     if not children:
         print_info("No children profiles found. Add a child profile first.")
         return
@@ -310,10 +317,10 @@ def schedule_vaccine_for_child(user):
         return
     child = children[choice - 1]
     # List all vaccines
-    vaccines = Vaccine.get_all()
+    vaccines = models.Vaccine.get_all()
     print(f"Available vaccines to schedule for {child.name}:")
     for i, vaccine in enumerate(vaccines, 1):
-        print(f"{i}. {vaccine.name} (Recommended at {vaccine.recommended_age_months} months)")
+        print(f"{i}. {vaccine.label} (Recommended at {vaccine.recommended_age_months} months)")
     try:
         vchoice = int(input("Select vaccine: ").strip())
     except ValueError:
@@ -325,8 +332,8 @@ def schedule_vaccine_for_child(user):
     vaccine = vaccines[vchoice - 1]
     scheduled_date = input("Enter scheduled date (YYYY-MM-DD): ").strip()
     try:
-        ChildVaccine.create(child.id, vaccine.id, scheduled_date)
-        print_success(f"Vaccine {vaccine.name} scheduled for {child.name} on {scheduled_date}.")
+        models.ChildVaccine.create(child.id, vaccine.id, scheduled_date)
+        print_success(f"Vaccine {vaccine.label} scheduled for {child.name} on {scheduled_date}.")
         # Show educational insights
         print("\nEducational Insights:")
         print(f"Vaccine: {vaccine.name}")
@@ -344,7 +351,7 @@ def view_due_soon_vaccines(user):
     print("VACCINES DUE SOON (Next 7 days)")
     print("-" * 50)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found.")
@@ -352,7 +359,7 @@ def view_due_soon_vaccines(user):
     
     due_soon_found = False
     for child in children:
-        upcoming_vaccines = ChildVaccine.find_upcoming_by_child_id(child.id)
+        upcoming_vaccines = models.ChildVaccine.find_upcoming_by_child_id(child.id, include=["vaccine"])
         due_soon = [cv for cv in upcoming_vaccines if cv.is_due_soon]
         
         if due_soon:
@@ -360,7 +367,7 @@ def view_due_soon_vaccines(user):
             print(f" {child.name}:")
             for cv in due_soon:
                 vaccine = cv.get_vaccine()
-                print(f"   • {vaccine.name} - Due: {cv.scheduled_date} (in {cv.days_until_due} days)")
+                print(f"   • {vaccine.label} - Due: {cv.scheduled_date} (in {cv.days_until_due} days)")
             print()
     
     if not due_soon_found:
@@ -372,21 +379,24 @@ def view_due_reminders(user):
     print(" DUE REMINDERS")
     print("-" * 30)
     
-    due_reminders = Reminder.find_due_reminders()
-    
-    if not due_reminders:
-        print_info("No due reminders found.")
-        return
+    due_reminders = models.Reminder.iter_due_reminders(
+        include=["child_vaccine.child", "child_vaccine.vaccine"]
+    )
     
+    found = False
     for reminder in due_reminders:
+        found = True
         child_vaccine = reminder.get_child_vaccine()
         child = child_vaccine.get_child()
         vaccine = child_vaccine.get_vaccine()
         
-        print(f"• {child.name} - {vaccine.name}")
+        print(f"• {child.name} - {vaccine.label}")
         print(f"  Due: {reminder.reminder_date}")
         print(f"  Message: {reminder.message}")
         print()
+    
+    if not found:
+        print_info("No due reminders found.")
 
 def create_custom_reminder(user):
     """Create a custom reminder for a child's vaccine"""
@@ -394,7 +404,7 @@ def create_custom_reminder(user):
     print(" CREATE CUSTOM REMINDER")
     print("-" * 30)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found. Add a child profile first.")
@@ -416,7 +426,7 @@ def create_custom_reminder(user):
 
 def create_reminder_for_child(child):
     """Create a reminder for a specific child"""
-    child_vaccines = ChildVaccine.find_by_child_id(child.id)
+    child_vaccines = models.ChildVaccine.find_by_child_id(child.id, include=["vaccine"])
     
     if not child_vaccines:
         print_info("No vaccines scheduled for this child.")
@@ -425,7 +435,7 @@ def create_reminder_for_child(child):
     print(f"\nSelect vaccine for {child.name}:")
     for i, cv in enumerate(child_vaccines, 1):
         vaccine = cv.get_vaccine()
-        print(f"{i}. {vaccine.name} - Due: {cv.scheduled_date}")
+        print(f"{i}. {vaccine.label} - Due: {cv.scheduled_date}")
     
     try:
         choice = int(input("Enter choice: ").strip())
@@ -436,7 +446,7 @@ def create_reminder_for_child(child):
             message = input("Reminder message: ").strip()
             
             if reminder_date and message:
-                reminder = Reminder.create(child_vaccine.id, reminder_date, message)
+                reminder = models.Reminder.create(child_vaccine.id, reminder_date, message)
                 print_success("Custom reminder created successfully!")
             else:
                 print_error("Reminder date and message are required.")
@@ -451,17 +461,11 @@ def change_language(user):
     print(" CHANGE LANGUAGE")
     print("-" * 30)
     
-    languages = ['en', 'swahili']
-    language_names = {
-        'en': 'English', 
-        'sw' : 'Swahili'
-    
-    }
-    
+    languages = LANGUAGES
     
     print("Available languages:")
     for i, lang in enumerate(languages, 1):
-        print(f"{i}. {language_names[lang]}")
+        print(f"{i}. {language_name(lang)}")
     
     try:
         choice = int(input("Enter choice: ").strip())
@@ -469,7 +473,7 @@ def change_language(user):
             new_language = languages[choice - 1]
             user.language = new_language
             user.save()
-            print_success(f"Language changed to {language_names[new_language]}!")
+            print_success(f"Language changed to {language_name(new_language)}!")
         else:
             print_error("Invalid choice.")
     except ValueError:
@@ -486,7 +490,7 @@ def change_password(user):
     current_password = input("Current password: ").strip()
     
     # Verify current password
-    if not User.authenticate(user.username, current_password):
+    if not models.User.authenticate(user.username, current_password):
         print_error("Current password is incorrect.")
         input("\nPress Enter to continue...")
         return
@@ -526,19 +530,8 @@ def delete_account(user):
     confirm = input("Are you absolutely sure? Type 'DELETE' to confirm: ").strip()
     
     if confirm == "DELETE":
-        # Delete all related data first
-        children = Child.find_by_user_id(user.id)
-        for child in children:
-            child_vaccines = ChildVaccine.find_by_child_id(child.id)
-            for cv in child_vaccines:
-                reminders = Reminder.find_by_child_vaccine_id(cv.id)
-                for reminder in reminders:
-                    reminder.delete()
-                cv.delete()
-            child.delete()
-        
-        # Delete user
-        user.delete()
+        # Children, schedules and reminders go with the user in one statement
+        user.delete(cascade=True)
         print_success("Account deleted successfully!")
         return True
     else:
@@ -547,7 +540,7 @@ def delete_account(user):
 
 def set_next_vaccine_reminder(user):
     """Streamlined flow: select child, show next vaccine, set reminder, then log out."""
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     if not children:
         print_info("No children profiles found. Add a child profile first.")
         return
@@ -564,14 +557,14 @@ def set_next_vaccine_reminder(user):
         return
     child = children[choice - 1]
     # List all upcoming vaccines for the child
-    upcoming = [cv for cv in ChildVaccine.find_by_child_id(child.id) if cv.status == 'scheduled' and cv.scheduled_date >= date.today()]
+    upcoming = [cv for cv in models.ChildVaccine.find_by_child_id(child.id, include=["vaccine"]) if cv.status == 'scheduled' and cv.scheduled_date >= date.today()]
     if not upcoming:
         print_info("No upcoming vaccines for this child.")
         return
     print(f"Upcoming vaccines for {child.name}:")
     for i, cv in enumerate(upcoming, 1):
         vaccine = cv.get_vaccine()
-        print(f"{i}. {vaccine.name} - Due: {cv.scheduled_date}")
+        print(f"{i}. {vaccine.label} - Due: {cv.scheduled_date}")
     try:
         vchoice = int(input("Select vaccine to set reminder for: ").strip())
     except ValueError:
@@ -582,11 +575,11 @@ def set_next_vaccine_reminder(user):
         return
     selected_cv = upcoming[vchoice - 1]
     vaccine = selected_cv.get_vaccine()
-    print(f"Setting reminder for {vaccine.name} on {selected_cv.scheduled_date}")
+    print(f"Setting reminder for {vaccine.label} on {selected_cv.scheduled_date}")
     reminder_date = input("Reminder date (YYYY-MM-DD): ").strip()
     message = input("Reminder message: ").strip()
     if reminder_date and message:
-        Reminder.create(selected_cv.id, reminder_date, message)
+        models.Reminder.create(selected_cv.id, reminder_date, message)
         print_success("Reminder set successfully!")
         print_success("Logging out...")
         exit_program()
@@ -596,19 +589,18 @@ def set_next_vaccine_reminder(user):
 
 def view_vaccine_schedule(child):
     """Display the vaccine schedule for a child in a table format."""
-    from .models.child_vaccine import ChildVaccine
     print(f"\nVaccine Schedule for {child.name}:")
     print("-" * 70)
     print(f"{'Vaccine':20} | {'Scheduled Date':15} | {'Status':10} | {'Completed Date':15}")
     print("-" * 70)
-    child_vaccines = ChildVaccine.find_by_child_id(child.id)
+    child_vaccines = models.ChildVaccine.find_by_child_id(child.id, include=["vaccine"])
     if not child_vaccines:
         print_info("No vaccines scheduled for this child.")
         return
     for cv in child_vaccines:
         vaccine = cv.get_vaccine()
         completed = cv.completed_date if cv.completed_date else "-"
-        print(f"{vaccine.name:20} | {str(cv.scheduled_date):15} | {cv.status:10} | {str(completed):15}")
+        print(f"{vaccine.label:20} | {str(cv.scheduled_date):15} | {cv.status:10} | {str(completed):15}")
     print("-" * 70)
 
 def notify_email_reminder_policy():
@@ -1,11 +1,666 @@
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from operator import itemgetter
+
+DB_PATH = os.environ.get("VACCINE_DB_PATH", "vaccine_reminder.db")
+DB_PROFILE = os.environ.get("VACCINE_DB_PROFILE", "default")
+POOL_SIZE = int(os.environ.get("VACCINE_DB_POOL_SIZE", "5"))
+POOL_TIMEOUT = 10.0
+FETCH_SIZE = int(os.environ.get("VACCINE_DB_FETCH_SIZE", "500"))
+PAGE_SIZE = 50
+HEALTH_CHECK_INTERVAL = 30.0
+# How DATE columns are stored: "iso" ('YYYY-MM-DD' text, readable by other
+# tools) or "days" (integer day numbers, date.toordinal())
+DATE_STORAGE = os.environ.get("VACCINE_DB_DATE_STORAGE", "iso")
+DATE_STORAGES = ("days", "iso")
+
+# Named PRAGMA profiles applied to every new connection.
+# "default" lets the CLI read while the reminder job writes (WAL) and only
+# fsyncs at checkpoints; "durable" fsyncs every commit; "bulk" trades crash
+# safety for speed during one-off imports; "legacy" is SQLite's own defaults.
+PROFILES = {
+    "default": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000,
+    },
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+}
+
+_PRAGMA_CHOICES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+_INTEGER_PRAGMAS = {"mmap_size", "cache_size", "busy_timeout"}
+
+
+def resolve_profile(profile):
+    """Turn a profile name or dict of overrides into a validated PRAGMA dict."""
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"Database profile must be one of: {', '.join(PROFILES)}")
+        return dict(PROFILES[profile])
+    settings = dict(PROFILES["default"])
+    settings.update(profile)
+    for name, value in settings.items():
+        if name in _INTEGER_PRAGMAS:
+            if not isinstance(value, int):
+                raise ValueError(f"{name} must be an integer")
+        elif name in _PRAGMA_CHOICES:
+            if str(value).upper() not in _PRAGMA_CHOICES[name]:
+                raise ValueError(f"{name} must be one of: {', '.join(sorted(_PRAGMA_CHOICES[name]))}")
+        else:
+            raise ValueError(f"Unknown database setting: {name}")
+    return settings
+
+
+def apply_profile(conn, profile=None):
+    """Apply a performance profile's PRAGMAs to an open connection."""
+    settings = resolve_profile(DB_PROFILE if profile is None else profile)
+    # busy_timeout first so switching journal mode waits out other writers
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+    for name, value in settings.items():
+        if name == "busy_timeout":
+            continue
+        if name in _INTEGER_PRAGMAS:
+            value = int(value)
+        else:
+            value = str(value).upper()
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+# Dates and timestamps are bound and decoded by sqlite3 itself: the
+# adapters below replace the deprecated built-in ones, and connections are
+# opened with PARSE_DECLTYPES so DATE and TIMESTAMP columns come back as
+# date/datetime objects.
+def _adapt_date(value):
+    if DATE_STORAGE == "days":
+        return value.toordinal()
+    return value.isoformat()
+
+
+def _adapt_datetime(value):
+    return value.isoformat(" ")
+
+
+# A value that doesn't parse (hand-edited or written by another tool) is
+# returned as text, as sqlite3 would without a converter, so one bad row
+# doesn't make the records around it unreadable.
+def _convert_date(value):
+    # Accept both storages so a row written before a storage switch still loads
+    try:
+        if value.isdigit():
+            return date.fromordinal(int(value))
+        return date.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode(errors="replace")
+
+
+def _convert_timestamp(value):
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode(errors="replace")
+
+
+# julianday() of day number 0, for converting between the two storages in SQL
+ORDINAL_EPOCH_JULIAN = 1721424.5
+
+
+def sql_day_number(expr):
+    """SQL for the integer day number of a DATE column or expression."""
+    if DATE_STORAGE == "days":
+        return expr
+    return f"CAST(julianday({expr}) - {ORDINAL_EPOCH_JULIAN} AS INTEGER)"
+
+
+def sql_date(day_expr):
+    """SQL turning an integer day number into a DATE value as it is stored."""
+    if DATE_STORAGE == "days":
+        return day_expr
+    return sql_iso_date(day_expr)
+
+
+def sql_iso_date(day_expr):
+    """SQL turning an integer day number into 'YYYY-MM-DD' text."""
+    return f"date({day_expr} + {ORDINAL_EPOCH_JULIAN})"
+
+
+sqlite3.register_adapter(date, _adapt_date)
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+
+
+def connect(path=None, profile=None, **kwargs):
+    """Open a new SQLite connection with the configured performance profile,
+    date/timestamp decoding and foreign key enforcement."""
+    kwargs.setdefault("detect_types", sqlite3.PARSE_DECLTYPES)
+    conn = sqlite3.connect(DB_PATH if path is None else path, **kwargs)
+    apply_profile(conn, profile)
+    # Deletes cascade through the schema (see migration 5), so this is
+    # not optional
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+class ConnectionPool:
+    """
+    A small pool of reusable SQLite connections.
+
+    Connections are created lazily up to `size`, handed out one thread at a
+    time and kept open when released, so SQLite's page cache and statement
+    cache survive between queries. Idle connections are health-checked with
+    a cheap `SELECT 1` before being reused.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL, profile=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.profile = profile
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._pid = os.getpid()
+        self._closed = False
+
+    def _connect(self):
+        return connect(self.path, self.profile, check_same_thread=False)
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if needed."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        while True:
+            try:
+                conn, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                try:
+                    conn, released_at = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+            idle_for = time.monotonic() - released_at
+            if idle_for < self.health_check_interval or self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def close_all(self):
+        """Close every idle connection and refuse further checkouts."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    @property
+    def stats(self):
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(path=None, profile=None, pool_size=None, timeout=None, health_check_interval=None,
+              date_storage=None):
+    """
+    Change database settings. `profile` is a name from PROFILES or a dict of
+    PRAGMA overrides; `date_storage` is one of DATE_STORAGES, and existing
+    dates are converted the next time the database is opened. Existing
+    pooled connections are closed and the pool is rebuilt on next use.
+    Switching to another database runs the callbacks registered with
+    on_database_change().
+    """
+    global DB_PATH, DB_PROFILE, POOL_SIZE, POOL_TIMEOUT, HEALTH_CHECK_INTERVAL, DATE_STORAGE, _pool
+    changed = path is not None and path != DB_PATH
+    with _pool_lock:
+        if path is not None:
+            DB_PATH = path
+        if profile is not None:
+            resolve_profile(profile)
+            DB_PROFILE = profile
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if timeout is not None:
+            POOL_TIMEOUT = timeout
+        if health_check_interval is not None:
+            HEALTH_CHECK_INTERVAL = health_check_interval
+        if date_storage is not None:
+            if date_storage not in DATE_STORAGES:
+                raise ValueError(f"Date storage must be one of: {', '.join(DATE_STORAGES)}")
+            DATE_STORAGE = date_storage
+            _initialized.clear()
+            _unreported.clear()
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+    if changed:
+        for callback in _database_change_callbacks:
+            callback()
+
+
+_database_change_callbacks = []
+
+
+def on_database_change(callback):
+    """
+    Register `callback()` to run whenever configure() points the process at
+    a different database, so in-process caches of its rows are dropped.
+    """
+    _database_change_callbacks.append(callback)
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use (and after fork)."""
+    global _pool
+    pool = _pool
+    if pool is None or pool._pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool._pid != os.getpid():
+                pool = ConnectionPool(DB_PATH, POOL_SIZE, POOL_TIMEOUT, HEALTH_CHECK_INTERVAL)
+                if DB_PATH not in _initialized:
+                    if DATE_STORAGE not in DATE_STORAGES:
+                        raise ValueError(f"Date storage must be one of: {', '.join(DATE_STORAGES)}")
+                    _unreported[DB_PATH] = _init_schema(pool)
+                    _initialized.add(DB_PATH)
+                _pool = pool
+            pool = _pool
+    return pool
+
+
+_initialized = set()
+# DB_PATH -> migrations applied on first use that init_db() hasn't returned yet
+_unreported = {}
+
+
+def _init_schema(pool):
+    # Imported here: migrations is only needed once per database per process
+    from .migrations import migrate, sync_date_storage
+    conn = pool.acquire()
+    try:
+        applied = migrate(conn)
+        sync_date_storage(conn, DATE_STORAGE)
+        return applied
+    finally:
+        pool.release(conn)
+
+
+def init_db():
+    """
+    Create or upgrade the schema of the configured database now and return
+    the migrations that were applied, counting those applied on an earlier
+    first use in this process that no init_db() call has returned yet. This
+    normally happens on first use of the database; when the schema is
+    current it costs one `PRAGMA user_version` read.
+    """
+    pool = get_pool()
+    applied = _unreported.pop(DB_PATH, None)
+    return _init_schema(pool) if applied is None else applied
+
+
+@contextmanager
+def connection():
+    """
+    Borrow a pooled connection for the current thread.
+    Usage:
+        with connection() as conn:
+            conn.execute(...)
+
+    Nested `with connection()` blocks in the same thread share one
+    connection; the outermost block commits on success and rolls back if
+    an exception escapes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    _local.conn = conn
+    _local.depth = 1
+    _local.callbacks = []
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        callbacks = _local.callbacks
+        _local.conn = None
+        _local.depth = 0
+        _local.callbacks = []
+        pool.release(conn)
+        for callback in callbacks:
+            callback()
+
+
+def after_transaction(callback):
+    """
+    Run `callback()` once the current thread's outermost connection() block
+    has committed or rolled back (immediately if there is none). Used to
+    drop in-process caches only when other threads can see the change.
+    """
+    if getattr(_local, "conn", None) is None:
+        callback()
+    else:
+        _local.callbacks.append(callback)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Group several model operations into one atomic transaction.
+    Usage:
+        with unit_of_work():
+            child = Child.create(...)
+            ChildVaccine.create(child.id, ...)
+
+    Every save()/delete() inside the block shares the same connection and is
+    committed once when the outermost block exits, or rolled back entirely
+    if an exception escapes. Nested blocks become savepoints, so an inner
+    failure that is caught only undoes the inner block's writes.
+    """
+    with connection() as conn:
+        if not conn.in_transaction:
+            # Take the write lock up front instead of upgrading mid-transaction
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                # Roll back here too: inside an outer connection() block the
+                # exception may be caught and the outer block would commit
+                conn.rollback()
+                raise
+            return
+
+        savepoint = f"uow_{_local.depth}"
+        conn.execute(f"SAVEPOINT {savepoint}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+            raise
+        conn.execute(f"RELEASE {savepoint}")
+
+
+MAX_IN_PARAMS = 500
+
+
+def chunked(values, size=MAX_IN_PARAMS):
+    """Split values into lists small enough for one `IN (...)` clause."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def placeholders(values):
+    return ", ".join("?" for _ in values)
+
+
+def insert_many(conn, sql, params):
+    """
+    Run an INSERT with executemany and return the new rows' ids in order.
+    Call inside a write transaction (e.g. unit_of_work) so no other writer
+    can interleave and the AUTOINCREMENT ids are contiguous.
+    """
+    params = list(params)
+    if not params:
+        return []
+    conn.executemany(sql, params)
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(params) + 1, last_id + 1))
+
+
+# Row-level fallbacks for values read without PARSE_DECLTYPES (e.g.
+# computed columns); values sqlite3 already decoded pass straight through.
+def _to_date(value):
+    if isinstance(value, date):
+        return value
+    if isinstance(value, int):
+        return date.fromordinal(value)
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _to_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+
+CONVERTERS = {
+    "date": _to_date,
+    "timestamp": _to_timestamp,
+    "bool": bool,
+}
+
+
+def register_converter(name, fn):
+    """Register a function that decodes a column value when rows are loaded."""
+    CONVERTERS[name] = fn
+    _loaders.clear()
+
+
+_loaders = {}
+
+
+def row_loader(cls, description):
+    """
+    Build a function that turns a database row into a `cls` instance
+    without running its property validators.
+
+    `cls._fields` maps column names to (attribute, converter name); columns
+    are matched by name from the cursor description, so column order and
+    extra columns don't matter. Values that can't be decoded are kept as
+    stored rather than raising, so old rows always load.
+    """
+    columns = tuple(column[0] for column in description)
+    key = (cls, columns)
+    loader = _loaders.get(key)
+    if loader is not None:
+        return loader
+
+    fields = cls._fields
+    indexes = [i for i, column in enumerate(columns) if column in fields]
+    attributes = [fields[columns[i]][0] for i in indexes]
+    conversions = [
+        (fields[columns[i]][0], CONVERTERS[fields[columns[i]][1]])
+        for i in indexes if fields[columns[i]][1]
+    ]
+    if len(indexes) > 1:
+        pick = itemgetter(*indexes)
+    else:
+        pick = lambda row: tuple(row[i] for i in indexes)
+    post_load = getattr(cls, "_post_load", None)
+    new = object.__new__
+
+    def load(row):
+        values = dict(zip(attributes, pick(row)))
+        for attribute, convert in conversions:
+            value = values[attribute]
+            if value is not None:
+                values[attribute] = convert(value)
+        obj = new(cls)
+        obj.__dict__.update(values)
+        if post_load is not None:
+            post_load(obj)
+        return obj
+
+    _loaders[key] = load
+    return load
+
+
+def load_one(cls, cursor):
+    """Load the next row from `cursor` as a `cls` instance, or None."""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row_loader(cls, cursor.description)(row)
+
+
+def load_all(cls, cursor):
+    """Load every remaining row from `cursor` as `cls` instances."""
+    return list(map(row_loader(cls, cursor.description), cursor.fetchall()))
+
+
+def iter_load(cls, sql, params=(), chunk_size=None, include=()):
+    """
+    Stream the rows of a query as `cls` instances, `chunk_size` rows
+    (default FETCH_SIZE) at a time with fetchmany, so memory use stays flat
+    however large the result is. Relationships named in `include` are
+    prefetched one chunk at a time.
+
+    The generator reads on its own pooled connection rather than the
+    thread's current one, so the caller may write (and commit) while
+    iterating. Close the generator, or exhaust it, to return the connection.
+    """
+    chunk_size = chunk_size or FETCH_SIZE
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        load = row_loader(cls, cursor.description)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            objects = [load(row) for row in rows]
+            if include:
+                cls.prefetch(objects, include)
+            yield from objects
+    finally:
+        pool.release(conn)
+
+
+_known_tables = set()
+
+
+def table_exists(name):
+    """True if `name` exists in the configured database (positive results are cached)."""
+    key = (DB_PATH, name)
+    if key in _known_tables:
+        return True
+    with connection() as conn:
+        cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+        found = cursor.fetchone() is not None
+    if found:
+        _known_tables.add(key)
+    return found
+
+
+def fts_prefix_query(text):
+    """
+    Turn free text into an FTS5 query where every word must match as a
+    prefix, e.g. "emm bak" -> '"emm"* "bak"*'. Returns "" if there are no
+    words. Quoting each word keeps FTS5 operators in user input inert.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
 
 def get_db():
     """
-    Returns a new connection and cursor to the SQLite database.
+    Returns a new, unpooled connection and cursor to the SQLite database.
+    Prefer `connection()` for anything on a hot path.
     Usage:
         conn, cursor = get_db()
     """
-    conn = sqlite3.connect("vaccine_reminder.db")
+    # Make sure the schema (and date storage) is current before handing out
+    # a connection that bypasses the pool
+    get_pool()
+    conn = connect()
     cursor = conn.cursor()
     return conn, cursor
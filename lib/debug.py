@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 # lib/debug.py
+# Usage: python -m lib.debug
 
-from models.__init__ import CONN, CURSOR
+from lib.db import get_db, init_db
+from lib.models import User, Child, Vaccine, ChildVaccine, Reminder
 import ipdb
 
+init_db()
+CONN, CURSOR = get_db()
 
 ipdb.set_trace()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# lib/dispatch.py
+"""
+Concurrent email dispatch.
+
+dispatch() sends a batch of (to, subject, body) messages over
+`concurrency` SMTP sessions at once, so the batch takes about
+latency * messages / concurrency rather than latency * messages. Each
+worker owns one transport (a Mailer by default, see lib/mailer.py);
+transports whose send() is a coroutine function are awaited directly,
+blocking ones like Mailer run on a thread pool. All workers draw from a
+token bucket shared per SMTP host, so the provider's rate limit holds no
+matter how many workers or runs are active in the process.
+
+    VACCINE_SMTP_CONCURRENCY   parallel SMTP sessions (default 4)
+    VACCINE_SMTP_RATE          messages per second per host (default 10)
+    VACCINE_SMTP_BURST         messages allowed at once before the rate
+                               applies (default: the concurrency)
+
+Usage: python -m lib.dispatch --bench [--count N] [--concurrency N] [--latency SECONDS]
+runs a batch against an in-process SMTP server (lib/local_smtp.py).
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.mailer import Mailer, MESSAGE_ERRORS, SMTP_HOST
+
+SMTP_CONCURRENCY = int(os.environ.get("VACCINE_SMTP_CONCURRENCY", "4"))
+SMTP_RATE = float(os.environ.get("VACCINE_SMTP_RATE", "10"))
+SMTP_BURST = int(os.environ.get("VACCINE_SMTP_BURST", "0")) or None
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average with bursts of up to
+    `burst`. Safe to share between threads and event loops: acquire() is
+    for coroutines, acquire_blocking() for threads.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # Take a token and return 0, or return how long to wait for one
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter_for(host, rate=None, burst=None):
+    """The shared TokenBucket for an SMTP host, created on first use."""
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(rate or SMTP_RATE, burst or SMTP_BURST or SMTP_CONCURRENCY)
+        return bucket
+
+
+async def _call(transport, method, executor, *args):
+    function = getattr(transport, method)
+    if inspect.iscoroutinefunction(function):
+        return await function(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+
+async def dispatch(messages, concurrency=None, transport_factory=Mailer, limiter=None, on_result=None):
+    """
+    Send messages with up to `concurrency` sessions. Each worker gets its
+    own transport from `transport_factory()`, which must provide close()
+    and send(*message); for a Mailer, messages are (to, subject, body).
+    Messages are taken at the rate allowed by `limiter` (default: the
+    bucket of the configured SMTP host). `on_result(message, error)` is
+    called after each send, with error None on success.
+
+    A refused message (MESSAGE_ERRORS) counts as failed and the batch
+    goes on; any other error stops every worker and is raised. Returns
+    (sent, failed).
+    """
+    concurrency = max(1, concurrency or SMTP_CONCURRENCY)
+    limiter = limiter or rate_limiter_for(SMTP_HOST)
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    concurrency = min(concurrency, queue.qsize()) or 1
+    counts = {"sent": 0, "failed": 0}
+
+    async def worker(executor):
+        transport = transport_factory()
+        try:
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await limiter.acquire()
+                try:
+                    await _call(transport, "send", executor, *message)
+                except MESSAGE_ERRORS as e:
+                    counts["failed"] += 1
+                    if on_result:
+                        on_result(message, e)
+                    continue
+                counts["sent"] += 1
+                if on_result:
+                    on_result(message, None)
+        finally:
+            await _call(transport, "close", executor)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="smtp") as executor:
+        tasks = [asyncio.ensure_future(worker(executor)) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    return counts["sent"], counts["failed"]
+
+
+def run_dispatch(messages, **kwargs):
+    """Blocking wrapper around dispatch() for scripts."""
+    return asyncio.run(dispatch(messages, **kwargs))
+
+
+def _bench(count, concurrency, latency):
+    from lib.local_smtp import LocalSMTPServer
+
+    messages = [(f"guardian{i}@example.org", "Vaccine Reminder", "Benchmark message") for i in range(count)]
+    with LocalSMTPServer(latency=latency) as server:
+        def factory():
+            return Mailer(server.host, server.port, "", "", sender="reminders@example.org", starttls=False)
+
+        limiter = TokenBucket(rate=1e6, burst=concurrency)
+        started = time.perf_counter()
+        sent, failed = run_dispatch(messages, concurrency=concurrency, transport_factory=factory, limiter=limiter)
+        elapsed = time.perf_counter() - started
+    print(f"Sent {sent} ({failed} failed) in {elapsed:.2f}s over {server.connections} session(s): "
+          f"{sent / elapsed:.0f} messages/s with {latency * 1000:.0f}ms server latency")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent email dispatch")
+    parser.add_argument("--bench", action="store_true", help="send a batch to an in-process SMTP server")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=SMTP_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the local server takes per message")
+    args = parser.parse_args(argv)
+    if not args.bench:
+        parser.error("nothing to do; reminders are sent with python -m lib.send_email_reminders")
+    _bench(args.count, args.concurrency, args.latency)
+
+
+if __name__ == "__main__":
+    main()
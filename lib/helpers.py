@@ -1,10 +1,8 @@
 # lib/helpers.py
-from .models.user import User
-from .models.child import Child
-from .models.vaccine import Vaccine
-from .models.child_vaccine import ChildVaccine
-from .models.reminder import Reminder
-from datetime import datetime, date, timedelta
+from . import models
+from .db import unit_of_work
+from .templates import LANGUAGES
+from datetime import datetime, date
 import os
 import re
 
@@ -89,7 +87,7 @@ def register_user():
     
     try:
         username = input("Username: ").strip()
-        if User.find_by_username(username):
+        if models.User.find_by_username(username):
             print_error("Username already exists")
             return None
         
@@ -97,7 +95,7 @@ def register_user():
         if not is_valid_email(email):
             print_error("Please enter a valid email address.")
             return None
-        if User.find_by_email(email):
+        if models.User.find_by_email(email):
             print_error("Email already registered")
             return None
         
@@ -106,9 +104,9 @@ def register_user():
             print_error("Password must be at least 6 characters")
             return None
         
-        language = get_valid_choice("Language (en/es/fr/de/ar/zh)", ['en', 'es', 'fr', 'de', 'ar', 'zh'])
+        language = get_valid_choice(f"Language ({'/'.join(LANGUAGES)})", list(LANGUAGES))
         
-        user = User.create(username, email, password, language)
+        user = models.User.create(username, email, password, language)
         print_success(f"User {username} registered successfully!")
         return user
         
@@ -126,7 +124,7 @@ def login_user():
     username = input("Username: ").strip()
     password = input("Password: ").strip()
     
-    user = User.authenticate(username, password)
+    user = models.User.authenticate(username, password)
     if user:
         print_success(f"Welcome back, {user.username}!")
         return user
@@ -154,12 +152,14 @@ def add_child_profile(user):
         
         gender = get_valid_choice("Gender (male/female/other)", ['male', 'female', 'other'])
         
-        child = Child.create(user.id, name, date_of_birth, gender)
-        print_success(f"Child profile for {name} created successfully!")
-        
-        # Auto-schedule vaccines based on age
-        schedule_vaccines_for_child(child)
+        # Profile and schedule are committed together or not at all
+        with unit_of_work():
+            child = models.Child.create(user.id, name, date_of_birth, gender)
+            
+            # Auto-schedule vaccines based on age
+            schedule_vaccines_for_child(child)
         
+        print_success(f"Child profile for {name} created successfully!")
         return child
         
     except ValueError as e:
@@ -167,28 +167,9 @@ def add_child_profile(user):
         return None
 
 def schedule_vaccines_for_child(child):
-    """Automatically schedule vaccines for a child based on their age"""
-    age_months = child.age_in_months
-    
-    # Get vaccines appropriate for child's age
-    vaccines = Vaccine.find_by_age_months(age_months)
-    
-    for vaccine in vaccines:
-        # Calculate scheduled date based on recommended age
-        scheduled_date = child.date_of_birth + timedelta(days=vaccine.recommended_age_months * 30)
-        
-        # Only schedule if not already scheduled
-        existing = ChildVaccine.find_by_child_id(child.id)
-        vaccine_ids = [cv.vaccine_id for cv in existing]
-        
-        if vaccine.id not in vaccine_ids:
-            child_vaccine = ChildVaccine.create(child.id, vaccine.id, scheduled_date)
-            
-            # Create reminder
-            reminder_date = scheduled_date - timedelta(days=7)  # 1 week before
-            if reminder_date >= date.today():
-                message = f"Reminder: {child.name} is due for {vaccine.name} on {scheduled_date}"
-                Reminder.create(child_vaccine.id, reminder_date, message)
+    """Automatically schedule the vaccines still ahead of a child"""
+    from .scheduling import schedule_child
+    return schedule_child(child)
 
 def view_child_profiles(user):
     """View all child profiles for a user"""
@@ -196,7 +177,7 @@ def view_child_profiles(user):
     print(" CHILD PROFILES")
     print("-" * 30)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found. Add a child profile first.")
@@ -215,7 +196,7 @@ def delete_child_profile(user):
     print(" DELETE CHILD PROFILE")
     print("-" * 30)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found.")
@@ -231,7 +212,7 @@ def delete_child_profile(user):
         
         confirm = input(f"Are you sure you want to delete {child.name}'s profile? (yes/no): ").strip().lower()
         if confirm == 'yes':
-            child.delete()
+            child.delete(cascade=True)
             print_success(f"{child.name}'s profile deleted successfully!")
         else:
             print_info("Deletion cancelled.")
@@ -246,7 +227,7 @@ def view_vaccine_schedule(child):
     print(f" VACCINE SCHEDULE FOR {child.name.upper()}")
     print("-" * 50)
     
-    child_vaccines = ChildVaccine.find_by_child_id(child.id)
+    child_vaccines = models.ChildVaccine.find_by_child_id(child.id, include=["vaccine"])
     
     if not child_vaccines:
         print_info("No vaccines scheduled for this child.")
@@ -265,7 +246,7 @@ def view_vaccine_schedule(child):
         for cv in overdue:
             vaccine = cv.get_vaccine()
             days_overdue = abs(cv.days_until_due)
-            print(f"   • {vaccine.name} - Due: {cv.scheduled_date} ({days_overdue} days overdue)")
+            print(f"   • {vaccine.label} - Due: {cv.scheduled_date} ({days_overdue} days overdue)")
         print()
     
     if scheduled:
@@ -273,16 +254,16 @@ def view_vaccine_schedule(child):
         for cv in scheduled:
             vaccine = cv.get_vaccine()
             if cv.is_due_soon:
-                print(f"   • {vaccine.name} - Due: {cv.scheduled_date} (Due soon!)")
+                print(f"   • {vaccine.label} - Due: {cv.scheduled_date} (Due soon!)")
             else:
-                print(f"   • {vaccine.name} - Due: {cv.scheduled_date} (in {cv.days_until_due} days)")
+                print(f"   • {vaccine.label} - Due: {cv.scheduled_date} (in {cv.days_until_due} days)")
         print()
     
     if completed:
         print(" COMPLETED VACCINES:")
         for cv in completed:
             vaccine = cv.get_vaccine()
-            print(f"   • {vaccine.name} - Completed: {cv.completed_date}")
+            print(f"   • {vaccine.label} - Completed: {cv.completed_date}")
         print()
 
 def mark_vaccine_complete(child):
@@ -292,7 +273,7 @@ def mark_vaccine_complete(child):
     print("-" * 50)
     
     # Get vaccines that are not completed
-    child_vaccines = [cv for cv in ChildVaccine.find_by_child_id(child.id) if cv.status != 'completed']
+    child_vaccines = [cv for cv in models.ChildVaccine.find_by_child_id(child.id, include=["vaccine"]) if cv.status != 'completed']
     
     if not child_vaccines:
         print_info("All vaccines are already completed!")
@@ -302,7 +283,7 @@ def mark_vaccine_complete(child):
     for i, cv in enumerate(child_vaccines, 1):
         vaccine = cv.get_vaccine()
         status = "OVERDUE" if cv.status == 'overdue' else "SCHEDULED"
-        print(f"{i}. {vaccine.name} - {status} - Due: {cv.scheduled_date}")
+        print(f"{i}. {vaccine.label} - {status} - Due: {cv.scheduled_date}")
     
     try:
         choice = get_valid_int("Enter choice", 1, len(child_vaccines))
@@ -312,7 +293,7 @@ def mark_vaccine_complete(child):
         child_vaccine.mark_completed(completed_date)
         
         vaccine = child_vaccine.get_vaccine()
-        print_success(f"{vaccine.name} marked as complete!")
+        print_success(f"{vaccine.label} marked as complete!")
         
     except ValueError as e:
         print_error(str(e))
@@ -323,7 +304,7 @@ def view_all_vaccines():
     print(" AVAILABLE VACCINES")
     print("-" * 30)
     
-    vaccines = Vaccine.get_all()
+    vaccines = models.Vaccine.get_all()
     
     if not vaccines:
         print_info("No vaccines found in the system.")
@@ -345,26 +326,21 @@ def view_reminders(user):
     print(" VACCINE REMINDERS")
     print("-" * 30)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found.")
         return
     
-    all_reminders = []
-    for child in children:
-        child_vaccines = ChildVaccine.find_by_child_id(child.id)
-        for cv in child_vaccines:
-            reminders = Reminder.find_by_child_vaccine_id(cv.id)
-            all_reminders.extend(reminders)
+    # Sorted by reminder date, with child and vaccine loaded up front
+    all_reminders = models.Reminder.find_by_user_id(
+        user.id, include=["child_vaccine.child", "child_vaccine.vaccine"]
+    )
     
     if not all_reminders:
         print_info("No reminders found.")
         return
     
-    # Sort by reminder date
-    all_reminders.sort(key=lambda r: r.reminder_date)
-    
     print("Upcoming Reminders:")
     for reminder in all_reminders:
         child_vaccine = reminder.get_child_vaccine()
@@ -372,7 +348,7 @@ def view_reminders(user):
         vaccine = child_vaccine.get_vaccine()
         
         status = "SENT" if reminder.sent else "PENDING"
-        print(f"• {child.name} - {vaccine.name}")
+        print(f"• {child.name} - {vaccine.label}")
         print(f"  Reminder Date: {reminder.reminder_date}")
         print(f"  Status: {status}")
         print(f"  Message: {reminder.message}")
@@ -384,7 +360,7 @@ def check_overdue_vaccines(user):
     print("OVERDUE VACCINES CHECK")
     print("-" * 30)
     
-    children = Child.find_by_user_id(user.id)
+    children = models.Child.find_by_user_id(user.id)
     
     if not children:
         print_info("No children profiles found.")
@@ -392,7 +368,7 @@ def check_overdue_vaccines(user):
     
     overdue_found = False
     for child in children:
-        overdue_vaccines = ChildVaccine.find_overdue_by_child_id(child.id)
+        overdue_vaccines = models.ChildVaccine.find_overdue_by_child_id(child.id, include=["vaccine"])
         
         if overdue_vaccines:
             overdue_found = True
@@ -401,7 +377,7 @@ def check_overdue_vaccines(user):
             for cv in overdue_vaccines:
                 vaccine = cv.get_vaccine()
                 days_overdue = abs(cv.days_until_due)
-                print(f"   • {vaccine.name} - {days_overdue} days overdue")
+                print(f"   • {vaccine.label} - {days_overdue} days overdue")
             print()
     
     if not overdue_found:
@@ -0,0 +1,135 @@
+# lib/local_smtp.py
+"""
+An in-process SMTP server for exercising email dispatch end to end
+without a real provider.
+
+    with LocalSMTPServer(latency=0.05) as server:
+        mailer = Mailer(server.host, server.port, starttls=False, sender="test@example.org")
+        ...
+        server.messages   # [(mail_from, [rcpt, ...], data), ...]
+
+It speaks just enough SMTP for smtplib: EHLO/HELO, AUTH PLAIN (any
+credentials are accepted), MAIL, RCPT, DATA, RSET, NOOP and QUIT. No
+STARTTLS, so clients must be created with starttls=False. `latency`
+seconds are added before each reply to DATA to stand in for a slow
+provider, and recipients in `reject` are refused with a 550. Stopping the
+server drops any client still connected.
+"""
+import asyncio
+import threading
+
+
+class LocalSMTPServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reject=()):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.reject = set(reject)
+        self.messages = []
+        self.connections = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._sessions = {}  # handler task -> its client's writer
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        task = asyncio.current_task()
+        self._sessions[task] = writer
+
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        mail_from, recipients = None, []
+        await reply("220 localhost ESMTP ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode().rstrip("\r\n").partition(" ")
+                command = command.upper()
+                if command == "EHLO":
+                    await reply("250-localhost")
+                    await reply("250-AUTH PLAIN")
+                    await reply("250 8BITMIME")
+                elif command == "HELO":
+                    await reply("250 localhost")
+                elif command == "AUTH":
+                    await reply("235 Authentication successful")
+                elif command == "MAIL":
+                    mail_from, recipients = argument.partition(":")[2].strip(), []
+                    await reply("250 OK")
+                elif command == "RCPT":
+                    recipient = argument.partition(":")[2].strip().strip("<>")
+                    if recipient in self.reject:
+                        await reply("550 No such user")
+                    else:
+                        recipients.append(recipient)
+                        await reply("250 OK")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while True:
+                        line = await reader.readline()
+                        if not line or line == b".\r\n":
+                            break
+                        data.append(line)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    self.messages.append((mail_from, recipients, b"".join(data)))
+                    mail_from, recipients = None, []
+                    await reply("250 Message accepted")
+                elif command in ("RSET", "NOOP"):
+                    mail_from, recipients = None, []
+                    await reply("250 OK")
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            del self._sessions[task]
+            writer.close()
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._server.close()
+            # Hang up on clients still connected and let their handlers
+            # finish, so none is left pending when the loop closes
+            handlers = list(self._sessions)
+            for writer in self._sessions.values():
+                writer.close()
+            if handlers:
+                self._loop.run_until_complete(asyncio.wait(handlers))
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="local-smtp", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
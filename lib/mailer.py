@@ -0,0 +1,139 @@
+# lib/mailer.py
+"""
+Outgoing email over one reusable SMTP session.
+
+Settings come from the environment:
+    VACCINE_SMTP_HOST       SMTP server (required to send)
+    VACCINE_SMTP_PORT       port (default 587)
+    VACCINE_SMTP_USER       login user; no login if unset
+    VACCINE_SMTP_PASSWORD   login password
+    VACCINE_SMTP_FROM       From address (default: VACCINE_SMTP_USER)
+    VACCINE_SMTP_STARTTLS   "0" to skip STARTTLS (default on)
+    VACCINE_SMTP_MAX_PER_SESSION
+                            messages sent before the session is renewed,
+                            to stay under provider per-connection limits
+"""
+import os
+import smtplib
+import socket
+from email.message import EmailMessage
+
+SMTP_HOST = os.environ.get("VACCINE_SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("VACCINE_SMTP_PORT", "587"))
+SMTP_USER = os.environ.get("VACCINE_SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("VACCINE_SMTP_PASSWORD", "")
+SMTP_FROM = os.environ.get("VACCINE_SMTP_FROM", "") or SMTP_USER
+SMTP_STARTTLS = os.environ.get("VACCINE_SMTP_STARTTLS", "1") != "0"
+SMTP_TIMEOUT = 30.0
+SMTP_MAX_PER_SESSION = int(os.environ.get("VACCINE_SMTP_MAX_PER_SESSION", "500"))
+SMTP_RETRIES = 2
+
+# Failures after which a fresh session may succeed
+_RETRYABLE = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, socket.timeout, ConnectionError)
+# Failures that only concern one message; the session stays usable
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def build_message(sender, to, subject, body):
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+class Mailer:
+    """
+    Sends a batch of messages over one authenticated SMTP session.
+    Usage:
+        with Mailer() as mailer:
+            mailer.send(to, subject, body)
+
+    The connection, STARTTLS and login happen once, on the first send,
+    and are reused for every message after that. A dropped connection or
+    a 4xx "try again" reply reconnects and retries the message (up to
+    `retries` times); the session is also renewed every
+    `max_per_session` messages.
+    """
+
+    def __init__(self, host=None, port=None, user=None, password=None, sender=None, starttls=None,
+                 timeout=SMTP_TIMEOUT, max_per_session=None, retries=SMTP_RETRIES):
+        self.host = SMTP_HOST if host is None else host
+        self.port = SMTP_PORT if port is None else port
+        self.user = SMTP_USER if user is None else user
+        self.password = SMTP_PASSWORD if password is None else password
+        self.sender = sender or SMTP_FROM or self.user
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.timeout = timeout
+        self.max_per_session = max_per_session or SMTP_MAX_PER_SESSION
+        self.retries = retries
+        if not self.host:
+            raise ValueError("SMTP is not configured: set VACCINE_SMTP_HOST")
+        if not self.sender:
+            raise ValueError("No From address: set VACCINE_SMTP_FROM or VACCINE_SMTP_USER")
+        self._smtp = None
+        self._session_sent = 0
+        self.sent = 0
+        self.connections = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._session_sent = 0
+        self.connections += 1
+
+    def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def send_message(self, message):
+        """Send a prepared EmailMessage, reconnecting if the session was lost."""
+        for attempt in range(self.retries + 1):
+            try:
+                if self._smtp is None or self._session_sent >= self.max_per_session:
+                    self._disconnect()
+                    self._connect()
+                self._smtp.send_message(message)
+            except _RETRYABLE:
+                self._disconnect()
+                if attempt == self.retries:
+                    raise
+            except MESSAGE_ERRORS:
+                raise
+            except smtplib.SMTPResponseException as e:
+                # 4xx is temporary (e.g. 421 closing connection); 5xx is final
+                self._disconnect()
+                if e.smtp_code >= 500 or attempt == self.retries:
+                    raise
+            else:
+                self._session_sent += 1
+                self.sent += 1
+                return
+
+    def send(self, to, subject, body):
+        self.send_message(build_message(self.sender, to, subject, body))
+
+    def close(self):
+        self._disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,468 @@
+# lib/migrations.py
+"""
+Versioned schema migrations.
+
+The schema version lives in SQLite's `PRAGMA user_version`. Each migration
+runs in its own transaction together with the version bump, so a database
+is never left half-migrated and `migrate()` is safe to call on every start.
+"""
+
+import sqlite3
+
+from .db import ORDINAL_EPOCH_JULIAN
+
+MIGRATIONS = []
+
+# First migration after which foreign keys must hold, see migrate()
+FOREIGN_KEYS_VERSION = 5
+
+
+def migration(version, description):
+    """Register a function taking a connection as schema migration `version`."""
+    def register(fn):
+        if any(m[0] == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version: {version}")
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """
+    Bring the database up to `target` (default: latest) and return the list
+    of (version, description) pairs that were applied. Concurrent callers
+    are serialised per migration; each is applied by exactly one of them.
+    """
+    target = latest_version() if target is None else target
+    version = current_version(conn)
+    applied = []
+    for number, description, fn in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        # Foreign keys are switched off while tables are rebuilt (this only
+        # works outside a transaction) and, once migration 5 has declared
+        # them, checked before committing. Earlier migrations may meet rows
+        # orphaned by old deletes, which migration 5 cleans up.
+        foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                if current_version(conn) >= number:
+                    conn.rollback()
+                    continue
+                fn(conn)
+                violations = []
+                if number >= FOREIGN_KEYS_VERSION:
+                    violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if violations:
+                    raise sqlite3.IntegrityError(
+                        f"Migration {number} left {len(violations)} foreign key violation(s)"
+                    )
+                conn.execute(f"PRAGMA user_version = {int(number)}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+        applied.append((number, description))
+    return applied
+
+
+@migration(1, "create base tables")
+def create_base_tables(conn):
+    # IF NOT EXISTS so databases created before migrations existed are
+    # adopted as version 1 without touching their data.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            language TEXT DEFAULT 'en',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS children (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            date_of_birth DATE NOT NULL,
+            gender TEXT CHECK(gender IN ('male', 'female', 'other')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vaccines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            recommended_age_months INTEGER NOT NULL,
+            dose_number INTEGER DEFAULT 1,
+            is_required BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS child_vaccines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            child_id INTEGER NOT NULL,
+            vaccine_id INTEGER NOT NULL,
+            scheduled_date DATE NOT NULL,
+            completed_date DATE,
+            status TEXT DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'completed', 'overdue')),
+            reminder_sent BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (child_id) REFERENCES children (id),
+            FOREIGN KEY (vaccine_id) REFERENCES vaccines (id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            child_vaccine_id INTEGER NOT NULL,
+            reminder_date DATE NOT NULL,
+            message TEXT NOT NULL,
+            sent BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (child_vaccine_id) REFERENCES child_vaccines (id)
+        )
+    """)
+
+
+@migration(2, "add lookup indexes")
+def add_lookup_indexes(conn):
+    # Child.find_by_user_id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_children_user_id ON children (user_id)")
+    # ChildVaccine.find_by_child_id / find_upcoming_by_child_id / find_overdue_by_child_id
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_child_vaccines_child_date
+        ON child_vaccines (child_id, scheduled_date)
+    """)
+    # ChildVaccine.find_due_soon and the reminder dispatcher
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_child_vaccines_status_date
+        ON child_vaccines (status, scheduled_date)
+    """)
+    # ChildVaccine.find_by_vaccine_id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_child_vaccines_vaccine_id ON child_vaccines (vaccine_id)")
+    # Reminder.find_due_reminders / find_upcoming_reminders
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reminders_sent_date
+        ON reminders (sent, reminder_date)
+    """)
+    # Reminder.find_by_child_vaccine_id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_child_vaccine_id ON reminders (child_vaccine_id)")
+    conn.execute("ANALYZE")
+
+
+@migration(3, "one schedule row per child and vaccine")
+def unique_child_vaccine(conn):
+    # Of each set of duplicate schedule rows, keep the completed one (the
+    # child's vaccination record), else the oldest. Point reminders of the
+    # duplicates at the row being kept, then drop the duplicates so the
+    # unique index can be built.
+    conn.execute("""
+        CREATE TEMP TABLE child_vaccine_keep AS
+        SELECT dup.id AS id, (
+            SELECT keep.id FROM child_vaccines keep
+            WHERE keep.child_id = dup.child_id AND keep.vaccine_id = dup.vaccine_id
+            ORDER BY keep.status = 'completed' DESC, keep.id
+            LIMIT 1
+        ) AS keep_id
+        FROM child_vaccines dup
+    """)
+    conn.execute("""
+        UPDATE reminders
+        SET child_vaccine_id = (
+            SELECT keep_id FROM child_vaccine_keep WHERE id = reminders.child_vaccine_id
+        )
+        WHERE child_vaccine_id IN (SELECT id FROM child_vaccine_keep WHERE id != keep_id)
+    """)
+    conn.execute("""
+        DELETE FROM child_vaccines
+        WHERE id IN (SELECT id FROM child_vaccine_keep WHERE id != keep_id)
+    """)
+    conn.execute("DROP TABLE child_vaccine_keep")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_child_vaccines_child_vaccine
+        ON child_vaccines (child_id, vaccine_id)
+    """)
+
+
+def _create_name_index(conn, table, columns):
+    # External-content FTS5 index over `columns` of `table`, kept in sync
+    # by triggers and filled from the existing rows.
+    fts = f"{table}_fts"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list},
+            content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    """)
+    conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+@migration(4, "full-text name search")
+def full_text_name_search(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search() falls back to LIKE
+        return
+    _create_name_index(conn, "children", ["name"])
+    _create_name_index(conn, "vaccines", ["name", "description"])
+
+
+def _rebuild_table(conn, table, create_sql):
+    """
+    Recreate `table` from `create_sql` (which must create `{table}_new`),
+    copying rows, AUTOINCREMENT position, indexes and triggers across.
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    dependents = [
+        row[0] for row in conn.execute("""
+            SELECT sql FROM sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """, (table,))
+    ]
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+
+    conn.execute(create_sql)
+    column_list = ", ".join(columns)
+    conn.execute(f"INSERT INTO {table}_new ({column_list}) SELECT {column_list} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if sequence is not None:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+    for sql in dependents:
+        conn.execute(sql)
+
+
+@migration(5, "cascade deletes from users down to reminders")
+def cascade_deletes(conn):
+    # Rows orphaned by earlier non-cascading deletes can't satisfy the new
+    # constraints and are unreachable from the app, so they are dropped.
+    # The exception is a completed dose of a vaccine that was deleted from
+    # the catalog: that is a child's vaccination record, so the migration
+    # stops and reports it instead.
+    lost = conn.execute("""
+        SELECT cv.vaccine_id, COUNT(*) FROM child_vaccines cv
+        JOIN children c ON c.id = cv.child_id
+        JOIN users u ON u.id = c.user_id
+        WHERE cv.status = 'completed' AND cv.vaccine_id NOT IN (SELECT id FROM vaccines)
+        GROUP BY cv.vaccine_id ORDER BY cv.vaccine_id
+    """).fetchall()
+    if lost:
+        raise sqlite3.IntegrityError(
+            f"Migration 5 would drop {sum(count for _, count in lost)} completed dose(s) of deleted vaccines "
+            f"({', '.join(f'vaccine id {id}: {count}' for id, count in lost)}); "
+            "re-create those vaccines with the same ids, or delete the doses, and start again"
+        )
+    conn.execute("DELETE FROM children WHERE user_id NOT IN (SELECT id FROM users)")
+    conn.execute("""
+        DELETE FROM child_vaccines
+        WHERE child_id NOT IN (SELECT id FROM children)
+           OR vaccine_id NOT IN (SELECT id FROM vaccines)
+    """)
+    conn.execute("DELETE FROM reminders WHERE child_vaccine_id NOT IN (SELECT id FROM child_vaccines)")
+
+    _rebuild_table(conn, "children", """
+        CREATE TABLE children_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            date_of_birth DATE NOT NULL,
+            gender TEXT CHECK(gender IN ('male', 'female', 'other')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    """)
+    _rebuild_table(conn, "child_vaccines", """
+        CREATE TABLE child_vaccines_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            child_id INTEGER NOT NULL,
+            vaccine_id INTEGER NOT NULL,
+            scheduled_date DATE NOT NULL,
+            completed_date DATE,
+            status TEXT DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'completed', 'overdue')),
+            reminder_sent BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (child_id) REFERENCES children (id) ON DELETE CASCADE,
+            FOREIGN KEY (vaccine_id) REFERENCES vaccines (id)
+        )
+    """)
+    _rebuild_table(conn, "reminders", """
+        CREATE TABLE reminders_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            child_vaccine_id INTEGER NOT NULL,
+            reminder_date DATE NOT NULL,
+            message TEXT NOT NULL,
+            sent BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (child_vaccine_id) REFERENCES child_vaccines (id) ON DELETE CASCADE
+        )
+    """)
+
+
+# Every DATE column, converted together when the date storage changes
+DATE_COLUMNS = {
+    "children": ["date_of_birth"],
+    "child_vaccines": ["scheduled_date", "completed_date"],
+    "reminders": ["reminder_date"],
+}
+
+
+@migration(6, "record how dates are stored")
+def record_date_storage(conn):
+    # Dates written so far are ISO text; sync_date_storage() converts them
+    # if the app is configured for day numbers
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO schema_settings (key, value) VALUES ('date_storage', 'iso')")
+
+
+def sync_date_storage(conn, storage):
+    """
+    Convert every DATE column to `storage` ("days" or "iso") if the database
+    currently uses the other one. Costs one lookup when nothing changes.
+    Returns True if dates were converted.
+    """
+    row = conn.execute("SELECT value FROM schema_settings WHERE key = 'date_storage'").fetchone()
+    if row is not None and row[0] == storage:
+        return False
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table, columns in DATE_COLUMNS.items():
+            for column in columns:
+                if storage == "days":
+                    # Unparseable text is left alone rather than nulled
+                    conn.execute(f"""
+                        UPDATE {table}
+                        SET {column} = CAST(julianday({column}) - {ORDINAL_EPOCH_JULIAN} AS INTEGER)
+                        WHERE typeof({column}) = 'text' AND julianday({column}) IS NOT NULL
+                    """)
+                else:
+                    conn.execute(f"""
+                        UPDATE {table}
+                        SET {column} = date({column} + {ORDINAL_EPOCH_JULIAN})
+                        WHERE typeof({column}) = 'integer'
+                    """)
+        conn.execute("""
+            INSERT INTO schema_settings (key, value) VALUES ('date_storage', ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        """, (storage,))
+        conn.execute("ANALYZE")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+@migration(7, "backfill checkpoints")
+def backfill_checkpoints(conn):
+    # One row per finished id range of a lib.backfill run, written in the
+    # same transaction as the range's schedules
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            run TEXT NOT NULL,
+            low_id INTEGER NOT NULL,
+            high_id INTEGER NOT NULL,
+            schedules INTEGER NOT NULL,
+            reminders INTEGER NOT NULL,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run, low_id)
+        )
+    """)
+
+
+@migration(8, "dose series rules on vaccines")
+def dose_series_rules(conn):
+    # See lib/rules.py; NULLs keep the old behaviour (due at the
+    # recommended age, skipped if missed)
+    conn.execute("ALTER TABLE vaccines ADD COLUMN min_age_days INTEGER")
+    conn.execute("ALTER TABLE vaccines ADD COLUMN max_age_days INTEGER")
+    conn.execute("ALTER TABLE vaccines ADD COLUMN min_interval_days INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vaccines_series ON vaccines (name, dose_number)")
+
+
+@migration(9, "email outbox")
+def email_outbox(conn):
+    # One row per email to send, fed from child_vaccines and reminders by
+    # lib/outbox.py. A worker leases rows by setting lease_owner and moving
+    # available_at (unix time) past now; rows whose lease has expired are
+    # claimable again
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL CHECK(kind IN ('dose', 'reminder')),
+            source_id INTEGER NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sent', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            UNIQUE (kind, source_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_claim ON outbox (status, available_at)")
+
+
+@migration(10, "outbox language")
+def outbox_language(conn):
+    # The guardian's language, for the footer and digest text added when
+    # the email is sent (see lib/templates.py)
+    conn.execute("ALTER TABLE outbox ADD COLUMN language TEXT NOT NULL DEFAULT 'en'")
@@ -1,7 +1,17 @@
-from ..db import get_db
+from ..db import connection, unit_of_work, insert_many, chunked, placeholders, load_one, load_all, iter_load, PAGE_SIZE, table_exists, fts_prefix_query
 from datetime import datetime, date
 
 class Child:
+    # Column -> (attribute, converter) for loading rows, see db.row_loader
+    _fields = {
+        "id": ("id", None),
+        "user_id": ("user_id", None),
+        "name": ("_name", None),
+        "date_of_birth": ("_date_of_birth", "date"),
+        "gender": ("_gender", None),
+        "created_at": ("created_at", "timestamp"),
+    }
+
     def __init__(self, user_id, name, date_of_birth, gender, id=None, created_at=None):
         self.id = id
         self.user_id = user_id
@@ -63,29 +73,38 @@ class Child:
 
     # ORM Methods
     def save(self):
-        conn, cursor = get_db()
-        if self.id:
-            cursor.execute("""
-                UPDATE children 
-                SET user_id = ?, name = ?, date_of_birth = ?, gender = ?
-                WHERE id = ?
-            """, (self.user_id, self.name, self.date_of_birth, self.gender, self.id))
-        else:
-            cursor.execute("""
-                INSERT INTO children (user_id, name, date_of_birth, gender, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (self.user_id, self.name, self.date_of_birth, self.gender, self.created_at))
-            self.id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # A changed date of birth moves the child's schedule with it; the
+        # delta from scheduling.reschedule_child() is kept in last_reschedule
+        with connection() as conn:
+            if self.id:
+                cursor = conn.execute("SELECT date_of_birth FROM children WHERE id = ?", (self.id,))
+                row = cursor.fetchone()
+                conn.execute("""
+                    UPDATE children 
+                    SET user_id = ?, name = ?, date_of_birth = ?, gender = ?
+                    WHERE id = ?
+                """, (self.user_id, self.name, self.date_of_birth, self.gender, self.id))
+                if row is not None and row[0] != self.date_of_birth:
+                    from ..scheduling import reschedule_child
+                    self.last_reschedule = reschedule_child(self)
+            else:
+                cursor = conn.execute("""
+                    INSERT INTO children (user_id, name, date_of_birth, gender, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (self.user_id, self.name, self.date_of_birth, self.gender, self.created_at))
+                self.id = cursor.lastrowid
         return self
 
-    def delete(self):
+    def delete(self, cascade=False):
+        # cascade=True also removes the schedule and its reminders via
+        # ON DELETE CASCADE; without it, refuse while any exist
         if self.id:
-            conn, cursor = get_db()
-            cursor.execute("DELETE FROM children WHERE id = ?", (self.id,))
-            conn.commit()
-            conn.close()
+            with connection() as conn:
+                if not cascade:
+                    cursor = conn.execute("SELECT 1 FROM child_vaccines WHERE child_id = ? LIMIT 1", (self.id,))
+                    if cursor.fetchone():
+                        raise ValueError("Child still has scheduled vaccines; delete with cascade=True")
+                conn.execute("DELETE FROM children WHERE id = ?", (self.id,))
             self.id = None
             return True
         return False
@@ -96,53 +115,152 @@ class Child:
         child.save()
         return child
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Validate and insert many children in a single transaction.
+        Each row is a tuple (user_id, name, date_of_birth, gender) or a dict of the same
+        keyword arguments. Returns the saved objects with their ids set.
+        """
+        children = [cls(**row) if isinstance(row, dict) else cls(*row) for row in rows]
+        with unit_of_work() as conn:
+            ids = insert_many(conn, """
+                INSERT INTO children (user_id, name, date_of_birth, gender, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, ((c.user_id, c.name, c.date_of_birth, c.gender, c.created_at) for c in children))
+        for c, id in zip(children, ids):
+            c.id = id
+        return children
+
     @classmethod
     def find_by_id(cls, id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM children WHERE id = ?", (id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[0], row[5])
-        return None
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM children WHERE id = ?", (id,))
+            return load_one(cls, cursor)
+
+    @classmethod
+    def find_by_ids(cls, ids):
+        # Batched lookup used for prefetching; returns {id: Child}
+        children = {}
+        with connection() as conn:
+            for chunk in chunked(set(ids)):
+                cursor = conn.execute(f"SELECT * FROM children WHERE id IN ({placeholders(chunk)})", chunk)
+                for child in load_all(cls, cursor):
+                    children[child.id] = child
+        return children
+
+    @classmethod
+    def find_languages_by_ids(cls, ids):
+        # {child id: guardian's language}, for rendering reminder messages
+        languages = {}
+        with connection() as conn:
+            for chunk in chunked(set(ids)):
+                cursor = conn.execute(f"""
+                    SELECT c.id, u.language FROM children c JOIN users u ON u.id = c.user_id
+                    WHERE c.id IN ({placeholders(chunk)})
+                """, chunk)
+                languages.update(cursor.fetchall())
+        return languages
+
+    @classmethod
+    def find_languages_by_id_range(cls, low_id, high_id):
+        # As find_languages_by_ids() for low_id < id <= high_id
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT c.id, u.language FROM children c JOIN users u ON u.id = c.user_id
+                WHERE c.id > ? AND c.id <= ?
+            """, (low_id, high_id))
+            return dict(cursor.fetchall())
 
     @classmethod
     def find_by_user_id(cls, user_id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM children WHERE user_id = ?", (user_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM children WHERE user_id = ?", (user_id,))
+            return load_all(cls, cursor)
 
     @classmethod
     def find_by_name(cls, name):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM children WHERE name LIKE ?", (f"%{name}%",))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM children WHERE name LIKE ?", (f"%{name}%",))
+            return load_all(cls, cursor)
+
+    @classmethod
+    def search(cls, text, user_id=None, limit=20):
+        """
+        Ranked name search with prefix matching ("emm" finds "Emma"), backed
+        by the children_fts index. Optionally limited to one user's children.
+        """
+        query = fts_prefix_query(text)
+        if not query:
+            return []
+        user_filter = "AND c.user_id = ?" if user_id is not None else ""
+        params = [user_id] if user_id is not None else []
+        with connection() as conn:
+            if table_exists("children_fts"):
+                cursor = conn.execute(f"""
+                    SELECT c.* FROM children_fts
+                    JOIN children c ON c.id = children_fts.rowid
+                    WHERE children_fts MATCH ? {user_filter}
+                    ORDER BY rank LIMIT ?
+                """, [query, *params, limit])
+            else:
+                cursor = conn.execute(f"""
+                    SELECT c.* FROM children c WHERE c.name LIKE ? {user_filter}
+                    ORDER BY c.name LIMIT ?
+                """, [f"%{text.strip()}%", *params, limit])
+            return load_all(cls, cursor)
 
     @classmethod
     def get_all(cls):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM children")
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM children")
+            return load_all(cls, cursor)
+
+    @classmethod
+    def iter_all(cls, chunk_size=None):
+        # Streams every child in id order without building a list
+        return iter_load(cls, "SELECT * FROM children ORDER BY id", (), chunk_size)
+
+    @classmethod
+    def find_by_id_range(cls, low_id, high_id):
+        # Children with low_id < id <= high_id, for partitioned batch jobs
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM children WHERE id > ? AND id <= ? ORDER BY id", (low_id, high_id))
+            return load_all(cls, cursor)
+
+    @classmethod
+    def iter_by_name(cls, name, chunk_size=None):
+        return iter_load(cls, "SELECT * FROM children WHERE name LIKE ? ORDER BY id", (f"%{name}%",), chunk_size)
+
+    @classmethod
+    def get_page(cls, after_id=0, limit=PAGE_SIZE):
+        # Keyset pagination: pass the last id of the previous page as after_id
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM children WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+            return load_all(cls, cursor)
+
+    @classmethod
+    def get_page_by_user_id(cls, user_id, after_id=0, limit=PAGE_SIZE):
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM children WHERE user_id = ? AND id > ?
+                ORDER BY id LIMIT ?
+            """, (user_id, after_id, limit))
+            return load_all(cls, cursor)
 
     def get_user(self):
-        from models.user import User
+        from .user import User
         return User.find_by_id(self.user_id)
 
     def get_vaccines(self):
-        from models.child_vaccine import ChildVaccine
+        from .child_vaccine import ChildVaccine
         return ChildVaccine.find_by_child_id(self.id)
 
     def get_upcoming_vaccines(self):
-        from models.child_vaccine import ChildVaccine
+        from .child_vaccine import ChildVaccine
         return ChildVaccine.find_upcoming_by_child_id(self.id)
 
     def get_overdue_vaccines(self):
-        from models.child_vaccine import ChildVaccine
+        from .child_vaccine import ChildVaccine
         return ChildVaccine.find_overdue_by_child_id(self.id)
 
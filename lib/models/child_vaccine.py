@@ -1,7 +1,22 @@
-from ..db import get_db
+from ..db import connection, unit_of_work, insert_many, chunked, placeholders, load_one, load_all, iter_load, PAGE_SIZE
 from datetime import datetime, date, timedelta
 
 class ChildVaccine:
+    # Column -> (attribute, converter) for loading rows, see db.row_loader
+    _fields = {
+        "id": ("id", None),
+        "child_id": ("child_id", None),
+        "vaccine_id": ("vaccine_id", None),
+        "scheduled_date": ("_scheduled_date", "date"),
+        "completed_date": ("_completed_date", "date"),
+        "status": ("_status", None),
+        "reminder_sent": ("_reminder_sent", "bool"),
+        "created_at": ("created_at", "timestamp"),
+    }
+
+    def _post_load(self):
+        self._related = {}
+
     def __init__(self, child_id, vaccine_id, scheduled_date, completed_date=None, status="scheduled", reminder_sent=False, id=None, created_at=None):
         self.id = id
         self.child_id = child_id
@@ -11,6 +26,8 @@ class ChildVaccine:
         self.status = status
         self.reminder_sent = reminder_sent
         self.created_at = created_at or datetime.now()
+        # Related objects attached by prefetch()
+        self._related = {}
 
     def __repr__(self):
         return f"<ChildVaccine {self.child_id}-{self.vaccine_id} ({self.status})>"
@@ -94,33 +111,35 @@ class ChildVaccine:
 
     # ORM Methods
     def save(self):
-        conn, cursor = get_db()
-        if self.id:
-            cursor.execute("""
-                UPDATE child_vaccines 
-                SET child_id = ?, vaccine_id = ?, scheduled_date = ?, completed_date = ?, 
-                    status = ?, reminder_sent = ?
-                WHERE id = ?
-            """, (self.child_id, self.vaccine_id, self.scheduled_date, self.completed_date, 
-                  self.status, self.reminder_sent, self.id))
-        else:
-            cursor.execute("""
-                INSERT INTO child_vaccines (child_id, vaccine_id, scheduled_date, completed_date, 
-                                          status, reminder_sent, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (self.child_id, self.vaccine_id, self.scheduled_date, self.completed_date, 
-                  self.status, self.reminder_sent, self.created_at))
-            self.id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with connection() as conn:
+            if self.id:
+                conn.execute("""
+                    UPDATE child_vaccines 
+                    SET child_id = ?, vaccine_id = ?, scheduled_date = ?, completed_date = ?, 
+                        status = ?, reminder_sent = ?
+                    WHERE id = ?
+                """, (self.child_id, self.vaccine_id, self.scheduled_date, self.completed_date, 
+                      self.status, self.reminder_sent, self.id))
+            else:
+                cursor = conn.execute("""
+                    INSERT INTO child_vaccines (child_id, vaccine_id, scheduled_date, completed_date, 
+                                              status, reminder_sent, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (self.child_id, self.vaccine_id, self.scheduled_date, self.completed_date, 
+                      self.status, self.reminder_sent, self.created_at))
+                self.id = cursor.lastrowid
         return self
 
-    def delete(self):
+    def delete(self, cascade=False):
+        # cascade=True also removes its reminders (ON DELETE CASCADE);
+        # without it, refuse while any exist
         if self.id:
-            conn, cursor = get_db()
-            cursor.execute("DELETE FROM child_vaccines WHERE id = ?", (self.id,))
-            conn.commit()
-            conn.close()
+            with connection() as conn:
+                if not cascade:
+                    cursor = conn.execute("SELECT 1 FROM reminders WHERE child_vaccine_id = ? LIMIT 1", (self.id,))
+                    if cursor.fetchone():
+                        raise ValueError("Vaccine schedule still has reminders; delete with cascade=True")
+                conn.execute("DELETE FROM child_vaccines WHERE id = ?", (self.id,))
             self.id = None
             return True
         return False
@@ -146,85 +165,192 @@ class ChildVaccine:
         child_vaccine.save()
         return child_vaccine
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Validate and insert many child vaccine schedules in a single transaction.
+        Each row is a tuple (child_id, vaccine_id, scheduled_date) or a dict of the same
+        keyword arguments. Returns the saved objects with their ids set.
+        """
+        child_vaccines = [cls(**row) if isinstance(row, dict) else cls(*row) for row in rows]
+        with unit_of_work() as conn:
+            ids = insert_many(conn, """
+                INSERT INTO child_vaccines (child_id, vaccine_id, scheduled_date, completed_date, 
+                                          status, reminder_sent, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, ((cv.child_id, cv.vaccine_id, cv.scheduled_date, cv.completed_date,
+                   cv.status, cv.reminder_sent, cv.created_at) for cv in child_vaccines))
+        for cv, id in zip(child_vaccines, ids):
+            cv.id = id
+        return child_vaccines
+
     @classmethod
     def find_by_id(cls, id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM child_vaccines WHERE id = ?", (id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7])
-        return None
-
-    @classmethod
-    def find_by_child_id(cls, child_id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM child_vaccines WHERE child_id = ? ORDER BY scheduled_date", (child_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7]) for row in rows]
-
-    @classmethod
-    def find_by_vaccine_id(cls, vaccine_id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM child_vaccines WHERE vaccine_id = ? ORDER BY scheduled_date", (vaccine_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7]) for row in rows]
-
-    @classmethod
-    def find_upcoming_by_child_id(cls, child_id):
-        conn, cursor = get_db()
-        cursor.execute("""
-            SELECT * FROM child_vaccines 
-            WHERE child_id = ? AND status = 'scheduled' AND scheduled_date >= ?
-            ORDER BY scheduled_date
-        """, (child_id, date.today()))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7]) for row in rows]
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM child_vaccines WHERE id = ?", (id,))
+            return load_one(cls, cursor)
 
     @classmethod
-    def find_overdue_by_child_id(cls, child_id):
-        conn, cursor = get_db()
-        cursor.execute("""
-            SELECT * FROM child_vaccines 
-            WHERE child_id = ? AND status != 'completed' AND scheduled_date < ?
-            ORDER BY scheduled_date
-        """, (child_id, date.today()))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7]) for row in rows]
+    def find_by_ids(cls, ids):
+        # Batched lookup used for prefetching; returns {id: ChildVaccine}
+        child_vaccines = {}
+        with connection() as conn:
+            for chunk in chunked(set(ids)):
+                cursor = conn.execute(f"SELECT * FROM child_vaccines WHERE id IN ({placeholders(chunk)})", chunk)
+                for child_vaccine in load_all(cls, cursor):
+                    child_vaccines[child_vaccine.id] = child_vaccine
+        return child_vaccines
+
+    @classmethod
+    def find_by_child_id(cls, child_id, include=()):
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM child_vaccines WHERE child_id = ? ORDER BY scheduled_date", (child_id,))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def find_by_vaccine_id(cls, vaccine_id, include=()):
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM child_vaccines WHERE vaccine_id = ? ORDER BY scheduled_date", (vaccine_id,))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def find_dose_dates_by_child_id(cls, child_id):
+        # {vaccine_id: date given (or scheduled)} for a child, the dose
+        # history used by scheduling rules
+        return cls.find_dose_dates_by_child_range(child_id - 1, child_id).get(child_id, {})
+
+    @classmethod
+    def find_dose_dates_by_child_range(cls, low_id, high_id):
+        # {child_id: {vaccine_id: date given (or scheduled)}} for children with low_id < id <= high_id
+        with connection() as conn:
+            rows = conn.execute("""
+                SELECT child_id, vaccine_id, completed_date, scheduled_date FROM child_vaccines
+                WHERE child_id > ? AND child_id <= ?
+            """, (low_id, high_id)).fetchall()
+        dates = {}
+        for child_id, vaccine_id, completed_date, scheduled_date in rows:
+            dates.setdefault(child_id, {})[vaccine_id] = completed_date or scheduled_date
+        return dates
+
+    @classmethod
+    def find_vaccine_ids_by_child_range(cls, low_id, high_id):
+        # {child_id: set of vaccine ids} for children with low_id < id <= high_id
+        with connection() as conn:
+            cursor = conn.execute(
+                "SELECT child_id, vaccine_id FROM child_vaccines WHERE child_id > ? AND child_id <= ?",
+                (low_id, high_id),
+            )
+            rows = cursor.fetchall()
+        scheduled = {}
+        for child_id, vaccine_id in rows:
+            scheduled.setdefault(child_id, set()).add(vaccine_id)
+        return scheduled
 
     @classmethod
-    def find_due_soon(cls, days=7):
+    def find_upcoming_by_child_id(cls, child_id, include=()):
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM child_vaccines 
+                WHERE child_id = ? AND status = 'scheduled' AND scheduled_date >= ?
+                ORDER BY scheduled_date
+            """, (child_id, date.today()))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def find_overdue_by_child_id(cls, child_id, include=()):
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM child_vaccines 
+                WHERE child_id = ? AND status != 'completed' AND scheduled_date < ?
+                ORDER BY scheduled_date
+            """, (child_id, date.today()))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def find_due_soon(cls, days=7, include=()):
         target_date = date.today() + timedelta(days=days)
-        conn, cursor = get_db()
-        cursor.execute("""
-            SELECT * FROM child_vaccines 
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM child_vaccines 
+                WHERE status = 'scheduled' AND scheduled_date <= ? AND scheduled_date >= ?
+                ORDER BY scheduled_date
+            """, (target_date, date.today()))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def get_all(cls, include=()):
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM child_vaccines ORDER BY scheduled_date")
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def iter_all(cls, chunk_size=None, include=()):
+        # Streams every schedule row in id order without building a list
+        return iter_load(cls, "SELECT * FROM child_vaccines ORDER BY id", (), chunk_size, include)
+
+    @classmethod
+    def iter_due_soon(cls, days=7, chunk_size=None, include=()):
+        target_date = date.today() + timedelta(days=days)
+        return iter_load(cls, """
+            SELECT * FROM child_vaccines
             WHERE status = 'scheduled' AND scheduled_date <= ? AND scheduled_date >= ?
             ORDER BY scheduled_date
-        """, (target_date, date.today()))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7]) for row in rows]
+        """, (target_date, date.today()), chunk_size, include)
+
+    @classmethod
+    def get_page(cls, after_id=0, limit=PAGE_SIZE, include=()):
+        # Keyset pagination: pass the last id of the previous page as after_id
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM child_vaccines WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+            return cls.prefetch(load_all(cls, cursor), include)
 
     @classmethod
-    def get_all(cls):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM child_vaccines ORDER BY scheduled_date")
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[6], row[0], row[7]) for row in rows]
+    def prefetch(cls, child_vaccines, include):
+        """
+        Load the relationships named in `include` ("child", "vaccine",
+        "reminders") for a list of child vaccines with one batched query each,
+        so get_child()/get_vaccine()/get_reminders() don't hit the database.
+        """
+        include = set(include)
+        unknown = include - {"child", "vaccine", "reminders"}
+        if unknown:
+            raise ValueError(f"Unknown ChildVaccine relationship(s): {', '.join(sorted(unknown))}")
+        if not child_vaccines:
+            return child_vaccines
+
+        if "child" in include:
+            from .child import Child
+            children = Child.find_by_ids(cv.child_id for cv in child_vaccines)
+            for cv in child_vaccines:
+                cv._related["child"] = children.get(cv.child_id)
+        if "vaccine" in include:
+            from .vaccine import Vaccine
+            vaccines = Vaccine.find_by_ids(cv.vaccine_id for cv in child_vaccines)
+            for cv in child_vaccines:
+                cv._related["vaccine"] = vaccines.get(cv.vaccine_id)
+        if "reminders" in include:
+            from .reminder import Reminder
+            reminders = Reminder.find_by_child_vaccine_ids(cv.id for cv in child_vaccines)
+            for cv in child_vaccines:
+                cv._related["reminders"] = reminders.get(cv.id, [])
+                for reminder in cv._related["reminders"]:
+                    reminder._related["child_vaccine"] = cv
+        return child_vaccines
 
     def get_child(self):
+        if "child" in self._related:
+            return self._related["child"]
         from .child import Child
         return Child.find_by_id(self.child_id)
 
     def get_vaccine(self):
+        if "vaccine" in self._related:
+            return self._related["vaccine"]
         from .vaccine import Vaccine
         return Vaccine.find_by_id(self.vaccine_id)
 
     def get_reminders(self):
+        if "reminders" in self._related:
+            return self._related["reminders"]
         from .reminder import Reminder
         return Reminder.find_by_child_vaccine_id(self.id)
@@ -1,7 +1,20 @@
-from ..db import get_db
+from ..db import connection, unit_of_work, insert_many, chunked, placeholders, load_one, load_all, iter_load, PAGE_SIZE
 from datetime import datetime, date
 
 class Reminder:
+    # Column -> (attribute, converter) for loading rows, see db.row_loader
+    _fields = {
+        "id": ("id", None),
+        "child_vaccine_id": ("child_vaccine_id", None),
+        "reminder_date": ("_reminder_date", "date"),
+        "message": ("_message", None),
+        "sent": ("_sent", "bool"),
+        "created_at": ("created_at", "timestamp"),
+    }
+
+    def _post_load(self):
+        self._related = {}
+
     def __init__(self, child_vaccine_id, reminder_date, message, sent=False, id=None, created_at=None):
         self.id = id
         self.child_vaccine_id = child_vaccine_id
@@ -9,6 +22,8 @@ class Reminder:
         self.message = message
         self.sent = sent
         self.created_at = created_at or datetime.now()
+        # Related objects attached by prefetch()
+        self._related = {}
 
     def __repr__(self):
         return f"<Reminder {self.id} for {self.child_vaccine_id} on {self.reminder_date}>"
@@ -60,29 +75,25 @@ class Reminder:
 
     # ORM Methods
     def save(self):
-        conn, cursor = get_db()
-        if self.id:
-            cursor.execute("""
-                UPDATE reminders 
-                SET child_vaccine_id = ?, reminder_date = ?, message = ?, sent = ?
-                WHERE id = ?
-            """, (self.child_vaccine_id, self.reminder_date, self.message, self.sent, self.id))
-        else:
-            cursor.execute("""
-                INSERT INTO reminders (child_vaccine_id, reminder_date, message, sent, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (self.child_vaccine_id, self.reminder_date, self.message, self.sent, self.created_at))
-            self.id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with connection() as conn:
+            if self.id:
+                conn.execute("""
+                    UPDATE reminders 
+                    SET child_vaccine_id = ?, reminder_date = ?, message = ?, sent = ?
+                    WHERE id = ?
+                """, (self.child_vaccine_id, self.reminder_date, self.message, self.sent, self.id))
+            else:
+                cursor = conn.execute("""
+                    INSERT INTO reminders (child_vaccine_id, reminder_date, message, sent, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (self.child_vaccine_id, self.reminder_date, self.message, self.sent, self.created_at))
+                self.id = cursor.lastrowid
         return self
 
     def delete(self):
         if self.id:
-            conn, cursor = get_db()
-            cursor.execute("DELETE FROM reminders WHERE id = ?", (self.id,))
-            conn.commit()
-            conn.close()
+            with connection() as conn:
+                conn.execute("DELETE FROM reminders WHERE id = ?", (self.id,))
             self.id = None
             return True
         return False
@@ -95,62 +106,138 @@ class Reminder:
         reminder.save()
         return reminder
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Validate and insert many reminders in a single transaction.
+        Each row is a tuple (child_vaccine_id, reminder_date, message) or a dict of the same
+        keyword arguments. Returns the saved objects with their ids set.
+        """
+        reminders = [cls(**row) if isinstance(row, dict) else cls(*row) for row in rows]
+        with unit_of_work() as conn:
+            ids = insert_many(conn, """
+                INSERT INTO reminders (child_vaccine_id, reminder_date, message, sent, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, ((r.child_vaccine_id, r.reminder_date, r.message, r.sent, r.created_at)
+                  for r in reminders))
+        for r, id in zip(reminders, ids):
+            r.id = id
+        return reminders
+
     @classmethod
     def find_by_id(cls, id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM reminders WHERE id = ?", (id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[0], row[5])
-        return None
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM reminders WHERE id = ?", (id,))
+            return load_one(cls, cursor)
 
     @classmethod
-    def find_by_child_vaccine_id(cls, child_vaccine_id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM reminders WHERE child_vaccine_id = ? ORDER BY reminder_date", (child_vaccine_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+    def find_by_child_vaccine_id(cls, child_vaccine_id, include=()):
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM reminders WHERE child_vaccine_id = ? ORDER BY reminder_date", (child_vaccine_id,))
+            return cls.prefetch(load_all(cls, cursor), include)
 
     @classmethod
-    def find_due_reminders(cls):
-        conn, cursor = get_db()
-        cursor.execute("""
-            SELECT * FROM reminders 
-            WHERE reminder_date <= ? AND sent = 0
-            ORDER BY reminder_date
-        """, (date.today(),))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+    def find_by_child_vaccine_ids(cls, child_vaccine_ids):
+        # Batched lookup used for prefetching; returns {child_vaccine_id: [Reminder]}
+        reminders = {}
+        with connection() as conn:
+            for chunk in chunked(set(child_vaccine_ids)):
+                cursor = conn.execute(f"""
+                    SELECT * FROM reminders WHERE child_vaccine_id IN ({placeholders(chunk)})
+                    ORDER BY reminder_date
+                """, chunk)
+                for reminder in load_all(cls, cursor):
+                    reminders.setdefault(reminder.child_vaccine_id, []).append(reminder)
+        return reminders
+
+    @classmethod
+    def find_by_user_id(cls, user_id, include=()):
+        # All reminders for one user's children, in a single join
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT r.* FROM reminders r
+                JOIN child_vaccines cv ON r.child_vaccine_id = cv.id
+                JOIN children c ON cv.child_id = c.id
+                WHERE c.user_id = ?
+                ORDER BY r.reminder_date
+            """, (user_id,))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def find_due_reminders(cls, include=()):
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM reminders 
+                WHERE reminder_date <= ? AND sent = 0
+                ORDER BY reminder_date
+            """, (date.today(),))
+            return cls.prefetch(load_all(cls, cursor), include)
 
     @classmethod
-    def find_upcoming_reminders(cls, days=7):
+    def find_upcoming_reminders(cls, days=7, include=()):
         from datetime import timedelta
         target_date = date.today() + timedelta(days=days)
-        conn, cursor = get_db()
-        cursor.execute("""
-            SELECT * FROM reminders 
-            WHERE reminder_date <= ? AND reminder_date >= ? AND sent = 0
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM reminders 
+                WHERE reminder_date <= ? AND reminder_date >= ? AND sent = 0
+                ORDER BY reminder_date
+            """, (target_date, date.today()))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def get_all(cls, include=()):
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM reminders ORDER BY reminder_date")
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def iter_all(cls, chunk_size=None, include=()):
+        # Streams every reminder in id order without building a list
+        return iter_load(cls, "SELECT * FROM reminders ORDER BY id", (), chunk_size, include)
+
+    @classmethod
+    def iter_due_reminders(cls, chunk_size=None, include=()):
+        return iter_load(cls, """
+            SELECT * FROM reminders
+            WHERE reminder_date <= ? AND sent = 0
             ORDER BY reminder_date
-        """, (target_date, date.today()))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+        """, (date.today(),), chunk_size, include)
 
     @classmethod
-    def get_all(cls):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM reminders ORDER BY reminder_date")
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+    def get_page(cls, after_id=0, limit=PAGE_SIZE, include=()):
+        # Keyset pagination: pass the last id of the previous page as after_id
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM reminders WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+            return cls.prefetch(load_all(cls, cursor), include)
+
+    @classmethod
+    def prefetch(cls, reminders, include):
+        """
+        Load the relationships named in `include` for a list of reminders in
+        batched queries. Supports "child_vaccine" and nested names such as
+        "child_vaccine.child" and "child_vaccine.vaccine".
+        """
+        include = set(include)
+        nested = {name.split(".", 1)[1] for name in include if name.startswith("child_vaccine.")}
+        unknown = include - {"child_vaccine"} - {f"child_vaccine.{name}" for name in nested}
+        if unknown:
+            raise ValueError(f"Unknown Reminder relationship(s): {', '.join(sorted(unknown))}")
+        if not reminders or not include:
+            return reminders
+
+        from .child_vaccine import ChildVaccine
+        child_vaccines = ChildVaccine.find_by_ids(r.child_vaccine_id for r in reminders)
+        ChildVaccine.prefetch(list(child_vaccines.values()), nested)
+        for reminder in reminders:
+            reminder._related["child_vaccine"] = child_vaccines.get(reminder.child_vaccine_id)
+        return reminders
 
     def get_child_vaccine(self):
-        from models.child_vaccine import ChildVaccine
+        if "child_vaccine" in self._related:
+            return self._related["child_vaccine"]
+        from .child_vaccine import ChildVaccine
         return ChildVaccine.find_by_id(self.child_vaccine_id)
-
     def get_child(self):
         child_vaccine = self.get_child_vaccine()
         if child_vaccine:
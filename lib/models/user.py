@@ -1,9 +1,19 @@
-from ..db import get_db
+from ..db import connection, load_one
 import hashlib
 from datetime import datetime
 
 # User model handles user registration, authentication, and user data
 class User:
+    # Column -> (attribute, converter) for loading rows, see db.row_loader
+    _fields = {
+        "id": ("id", None),
+        "username": ("_username", None),
+        "email": ("_email", None),
+        "password_hash": ("_password_hash", None),
+        "language": ("_language", None),
+        "created_at": ("created_at", "timestamp"),
+    }
+
     @classmethod
     def authenticate(cls, username, password):
         import hashlib
@@ -46,22 +56,6 @@ class User:
     @email.setter
     def email(self, value):
         # Email must be valid format
-        def save(self):
-            # Save or update user in the database
-            conn, cursor = get_db()
-            if self.id:
-                cursor.execute("""
-                    UPDATE users SET username=?, email=?, password_hash=?, language=? WHERE id=?
-                """, (self.username, self.email, self.password_hash, self.language, self.id))
-            else:
-                cursor.execute("""
-                    INSERT INTO users (username, email, password_hash, language, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (self.username, self.email, self.password_hash, self.language, self.created_at))
-                self.id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return self
         if not value or '@' not in value:
             raise ValueError("Email must be a valid email address")
         self._email = value.lower().strip()
@@ -82,36 +76,38 @@ class User:
 
     @language.setter
     def language(self, value):
-        # Only allow supported languages
-        valid_languages = ['en']
-        if value not in valid_languages:
-            raise ValueError(f"Language must be one of: {', '.join(valid_languages)}")
+        # Only languages with message templates (lib/locales/)
+        from ..templates import LANGUAGES
+        if value not in LANGUAGES:
+            raise ValueError(f"Language must be one of: {', '.join(LANGUAGES)}")
         self._language = value
 
     # ORM Methods for database interaction
     def save(self):
         # Save or update user in the database
-        conn, cursor = get_db()
-        if self.id:
-            cursor.execute("""
-                UPDATE users SET username=?, email=?, password_hash=?, language=? WHERE id=?
-            """, (self.username, self.email, self.password_hash, self.language, self.id))
-        else:
-            cursor.execute("""
-                INSERT INTO users (username, email, password_hash, language, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (self.username, self.email, self.password_hash, self.language, self.created_at))
-            self.id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with connection() as conn:
+            if self.id:
+                conn.execute("""
+                    UPDATE users SET username=?, email=?, password_hash=?, language=? WHERE id=?
+                """, (self.username, self.email, self.password_hash, self.language, self.id))
+            else:
+                cursor = conn.execute("""
+                    INSERT INTO users (username, email, password_hash, language, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (self.username, self.email, self.password_hash, self.language, self.created_at))
+                self.id = cursor.lastrowid
         return self
 
-    def delete(self):
+    def delete(self, cascade=False):
+        # cascade=True also removes the user's children, schedules and
+        # reminders via ON DELETE CASCADE; without it, refuse while any exist
         if self.id:
-            conn, cursor = get_db()
-            cursor.execute("DELETE FROM users WHERE id = ?", (self.id,))
-            conn.commit()
-            conn.close()
+            with connection() as conn:
+                if not cascade:
+                    cursor = conn.execute("SELECT 1 FROM children WHERE user_id = ? LIMIT 1", (self.id,))
+                    if cursor.fetchone():
+                        raise ValueError("User still has child profiles; delete with cascade=True")
+                conn.execute("DELETE FROM users WHERE id = ?", (self.id,))
             self.id = None
             return True
         return False
@@ -126,31 +122,19 @@ class User:
 
     @classmethod
     def find_by_username(cls, username):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[0], row[5])
-        return None
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM users WHERE username = ?", (username,))
+            return load_one(cls, cursor)
 
     @classmethod
     def find_by_email(cls, email):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[0], row[5])
-        return None
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM users WHERE email = ?", (email,))
+            return load_one(cls, cursor)
 
     @classmethod
     def find_by_id(cls, id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM users WHERE id = ?", (id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[0], row[5])
-        return None
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM users WHERE id = ?", (id,))
+            return load_one(cls, cursor)
 
@@ -1,19 +1,121 @@
-from ..db import get_db
+from ..db import connection, unit_of_work, insert_many, after_transaction, on_database_change, load_all, iter_load, table_exists, fts_prefix_query
 from datetime import datetime
+from bisect import bisect_right
+import threading
+
+
+class VaccineCatalog:
+    """
+    Process-wide in-memory copy of the vaccines table.
+
+    The catalog is small and rarely changes, so it is loaded once and then
+    served from dictionaries and a list sorted by recommended age. Finders
+    hand out copies, so editing a returned vaccine leaves the catalog alone
+    until it is saved. Vaccine save()/delete()/bulk_create() invalidate it; a thread that has written
+    vaccines in a still-open transaction reads around the cache until that
+    transaction ends, and db.configure() drops it when the database changes.
+    Changes made by other processes are picked up after invalidate() is
+    called or the process restarts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM vaccines ORDER BY recommended_age_months, id")
+            by_age = load_all(Vaccine, cursor)
+        return {
+            "by_id": {vaccine.id: vaccine for vaccine in by_age},
+            "by_age": by_age,
+            "ages": [vaccine.recommended_age_months for vaccine in by_age],
+            "required": [vaccine for vaccine in by_age if vaccine.is_required],
+        }
+
+    def snapshot(self):
+        if getattr(self._local, "dirty", False):
+            # Uncommitted vaccine writes on this thread: never cache them
+            self.misses += 1
+            return self._load()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+        self.misses += 1
+        generation = self._generation
+        snapshot = self._load()
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def _transaction_finished(self):
+        self._local.dirty = False
+        self.invalidate()
+
+    def changed(self):
+        # Called by Vaccine writes from inside their connection() block
+        self.invalidate()
+        if not getattr(self._local, "dirty", False):
+            self._local.dirty = True
+            after_transaction(self._transaction_finished)
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "loaded": self._snapshot is not None}
+
 
 class Vaccine:
-    def __init__(self, name, description, recommended_age_months, dose_number=1, is_required=True, id=None, created_at=None):
+    # Column -> (attribute, converter) for loading rows, see db.row_loader
+    _fields = {
+        "id": ("id", None),
+        "name": ("_name", None),
+        "description": ("_description", None),
+        "recommended_age_months": ("_recommended_age_months", None),
+        "dose_number": ("_dose_number", None),
+        "is_required": ("_is_required", "bool"),
+        "min_age_days": ("_min_age_days", None),
+        "max_age_days": ("_max_age_days", None),
+        "min_interval_days": ("_min_interval_days", None),
+        "created_at": ("created_at", "timestamp"),
+    }
+
+    # Columns whose change moves existing doses, see save(); name and
+    # dose_number decide which series a dose belongs to and its place in it
+    _schedule_columns = ("name", "dose_number", "recommended_age_months", "min_age_days", "max_age_days",
+                         "min_interval_days")
+
+    def __init__(self, name, description, recommended_age_months, dose_number=1, is_required=True,
+                 min_age_days=None, max_age_days=None, min_interval_days=0, id=None, created_at=None):
         self.id = id
         self.name = name
         self.description = description
         self.recommended_age_months = recommended_age_months
         self.dose_number = dose_number
         self.is_required = is_required
+        self.min_age_days = min_age_days
+        self.max_age_days = max_age_days
+        self.min_interval_days = min_interval_days
         self.created_at = created_at or datetime.now()
 
     def __repr__(self):
         return f"<Vaccine {self.name} ({self.recommended_age_months} months, Dose {self.dose_number})>"
 
+    @property
+    def label(self):
+        # Tells the doses of a series apart in lists, e.g. "DTaP (dose 3)"
+        return f"{self.name} (dose {self.dose_number})"
+
     @property
     def name(self):
         return self._name
@@ -68,83 +170,199 @@ class Vaccine:
         else:
             raise ValueError("is_required must be a boolean or integer value")
 
+    # Series rules, see lib/rules.py
+    @property
+    def min_age_days(self):
+        return self._min_age_days
+
+    @min_age_days.setter
+    def min_age_days(self, value):
+        if value is not None and (not isinstance(value, int) or value < 0):
+            raise ValueError("Minimum age must be a positive number of days")
+        self._min_age_days = value
+
+    @property
+    def max_age_days(self):
+        return self._max_age_days
+
+    @max_age_days.setter
+    def max_age_days(self, value):
+        if value is not None and (not isinstance(value, int) or value < 0):
+            raise ValueError("Maximum age must be a positive number of days")
+        self._max_age_days = value
+
+    @property
+    def min_interval_days(self):
+        return self._min_interval_days
+
+    @min_interval_days.setter
+    def min_interval_days(self, value):
+        if not isinstance(value, int) or value < 0:
+            raise ValueError("Minimum interval must be a positive number of days")
+        self._min_interval_days = value
+
+    def copy(self):
+        # Shallow is enough: every attribute is an immutable value
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        return clone
+
     # ORM Methods
     def save(self):
-        conn, cursor = get_db()
-        if self.id:
-            cursor.execute("""
-                UPDATE vaccines 
-                SET name = ?, description = ?, recommended_age_months = ?, dose_number = ?, is_required = ?
-                WHERE id = ?
-            """, (self.name, self.description, self.recommended_age_months, self.dose_number, self.is_required, self.id))
-        else:
-            cursor.execute("""
-                INSERT INTO vaccines (name, description, recommended_age_months, dose_number, is_required, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (self.name, self.description, self.recommended_age_months, self.dose_number, self.is_required, self.created_at))
-            self.id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # A changed age, interval or series rule moves the existing doses of
+        # this vaccine's series once the edit is committed; the delta from
+        # scheduling.reschedule_vaccine() is kept in last_reschedule
+        previous = None
+        with connection() as conn:
+            if self.id:
+                cursor = conn.execute(
+                    f"SELECT {', '.join(self._schedule_columns)} FROM vaccines WHERE id = ?", (self.id,)
+                )
+                previous = cursor.fetchone()
+                conn.execute("""
+                    UPDATE vaccines 
+                    SET name = ?, description = ?, recommended_age_months = ?, dose_number = ?, is_required = ?,
+                        min_age_days = ?, max_age_days = ?, min_interval_days = ?
+                    WHERE id = ?
+                """, (self.name, self.description, self.recommended_age_months, self.dose_number, self.is_required,
+                      self.min_age_days, self.max_age_days, self.min_interval_days, self.id))
+                # Before rescheduling, which reads the series from the catalog
+                catalog.changed()
+            else:
+                cursor = conn.execute("""
+                    INSERT INTO vaccines (name, description, recommended_age_months, dose_number, is_required,
+                                          min_age_days, max_age_days, min_interval_days, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (self.name, self.description, self.recommended_age_months, self.dose_number, self.is_required,
+                      self.min_age_days, self.max_age_days, self.min_interval_days, self.created_at))
+                self.id = cursor.lastrowid
+                catalog.changed()
+        # Outside the write above so the registry-wide pass can commit in chunks
+        if previous is not None and tuple(previous) != tuple(getattr(self, column) for column in self._schedule_columns):
+            from ..scheduling import reschedule_vaccine
+            self.last_reschedule = reschedule_vaccine(self, previous_name=previous[0])
         return self
 
-    def delete(self):
+    def delete(self, cascade=False):
+        # cascade=True also removes every child's doses of this vaccine,
+        # completed ones included, and their reminders; without it, refuse
+        # while any exist. The schedule's vaccine key has no ON DELETE
+        # CASCADE, so the doses are deleted here.
         if self.id:
-            conn, cursor = get_db()
-            cursor.execute("DELETE FROM vaccines WHERE id = ?", (self.id,))
-            conn.commit()
-            conn.close()
+            with unit_of_work() as conn:
+                if not cascade:
+                    cursor = conn.execute("SELECT 1 FROM child_vaccines WHERE vaccine_id = ? LIMIT 1", (self.id,))
+                    if cursor.fetchone():
+                        raise ValueError("Vaccine is still scheduled for children; delete with cascade=True")
+                else:
+                    conn.execute("DELETE FROM child_vaccines WHERE vaccine_id = ?", (self.id,))
+                conn.execute("DELETE FROM vaccines WHERE id = ?", (self.id,))
+                catalog.changed()
             self.id = None
             return True
         return False
 
     @classmethod
-    def create(cls, name, description, recommended_age_months, dose_number=1, is_required=True):
-        vaccine = cls(name, description, recommended_age_months, dose_number, is_required)
+    def create(cls, name, description, recommended_age_months, dose_number=1, is_required=True,
+               min_age_days=None, max_age_days=None, min_interval_days=0):
+        vaccine = cls(name, description, recommended_age_months, dose_number, is_required,
+                      min_age_days, max_age_days, min_interval_days)
         vaccine.save()
         return vaccine
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Validate and insert many vaccines in a single transaction.
+        Each row is a tuple (name, description, recommended_age_months, dose_number, is_required,
+        min_age_days, max_age_days, min_interval_days) or a dict of the same keyword arguments.
+        Returns the saved objects with their ids set.
+        """
+        vaccines = [cls(**row) if isinstance(row, dict) else cls(*row) for row in rows]
+        with unit_of_work() as conn:
+            ids = insert_many(conn, """
+                INSERT INTO vaccines (name, description, recommended_age_months, dose_number, is_required,
+                                      min_age_days, max_age_days, min_interval_days, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, ((v.name, v.description, v.recommended_age_months, v.dose_number, v.is_required,
+                   v.min_age_days, v.max_age_days, v.min_interval_days, v.created_at)
+                  for v in vaccines))
+            catalog.changed()
+        for v, id in zip(vaccines, ids):
+            v.id = id
+        return vaccines
+
     @classmethod
     def find_by_id(cls, id):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM vaccines WHERE id = ?", (id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return cls(row[1], row[2], row[3], row[4], row[5], row[0], row[6])
-        return None
+        vaccine = catalog.snapshot()["by_id"].get(id)
+        return vaccine and vaccine.copy()
+
+    @classmethod
+    def find_by_ids(cls, ids):
+        # Batched lookup used for prefetching; returns {id: Vaccine}
+        by_id = catalog.snapshot()["by_id"]
+        return {id: by_id[id].copy() for id in set(ids) if id in by_id}
 
     @classmethod
     def find_by_name(cls, name):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM vaccines WHERE name LIKE ?", (f"%{name}%",))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[0], row[6]) for row in rows]
+        with connection() as conn:
+            cursor = conn.execute("SELECT * FROM vaccines WHERE name LIKE ?", (f"%{name}%",))
+            return load_all(cls, cursor)
+
+    @classmethod
+    def iter_by_name(cls, name, chunk_size=None):
+        return iter_load(cls, "SELECT * FROM vaccines WHERE name LIKE ? ORDER BY id", (f"%{name}%",), chunk_size)
+
+    @classmethod
+    def search(cls, text, limit=20):
+        """
+        Ranked search over vaccine names and descriptions with prefix
+        matching; name matches rank above description matches.
+        """
+        query = fts_prefix_query(text)
+        if not query:
+            return []
+        with connection() as conn:
+            if table_exists("vaccines_fts"):
+                cursor = conn.execute("""
+                    SELECT v.* FROM vaccines_fts
+                    JOIN vaccines v ON v.id = vaccines_fts.rowid
+                    WHERE vaccines_fts MATCH ?
+                    ORDER BY bm25(vaccines_fts, 10.0, 1.0) LIMIT ?
+                """, (query, limit))
+            else:
+                cursor = conn.execute("""
+                    SELECT * FROM vaccines WHERE name LIKE ? OR description LIKE ?
+                    ORDER BY name LIMIT ?
+                """, (f"%{text.strip()}%", f"%{text.strip()}%", limit))
+            return load_all(cls, cursor)
 
     @classmethod
     def find_by_age_months(cls, age_months):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM vaccines WHERE recommended_age_months <= ? ORDER BY recommended_age_months", (age_months,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[0], row[6]) for row in rows]
+        snapshot = catalog.snapshot()
+        return [v.copy() for v in snapshot["by_age"][:bisect_right(snapshot["ages"], age_months)]]
 
     @classmethod
     def find_required(cls):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM vaccines WHERE is_required = 1 ORDER BY recommended_age_months")
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[0], row[6]) for row in rows]
+        return [v.copy() for v in catalog.snapshot()["required"]]
 
     @classmethod
     def get_all(cls):
-        conn, cursor = get_db()
-        cursor.execute("SELECT * FROM vaccines ORDER BY recommended_age_months")
-        rows = cursor.fetchall()
-        conn.close()
-        return [cls(row[1], row[2], row[3], row[4], row[5], row[0], row[6]) for row in rows]
+        return [v.copy() for v in catalog.snapshot()["by_age"]]
+
+    @classmethod
+    def find_series(cls, name):
+        # Every dose of a series, in dose order
+        return sorted((v.copy() for v in catalog.snapshot()["by_age"] if v.name == name), key=lambda v: v.dose_number)
+
+    @classmethod
+    def cache_stats(cls):
+        return catalog.stats
 
     def get_child_vaccines(self):
-        from models.child_vaccine import ChildVaccine
+        from .child_vaccine import ChildVaccine
         return ChildVaccine.find_by_vaccine_id(self.id)
+
+
+catalog = VaccineCatalog()
+on_database_change(catalog.invalidate)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# lib/outbox.py
+"""
+Durable email outbox shared by any number of dispatch workers.
+
+enqueue_due() copies the emails that are due into the outbox table, once
+per source row: doses up to EMAIL_LEAD_DAYS away whose reminder_sent is
+still unset, and unsent reminders dated within the last
+REMINDER_WINDOW_DAYS. Selecting windows rather than exact dates means a
+day the job doesn't run is caught up by the next run. Workers then:
+
+    claim()    lease a batch of pending rows in a short write transaction,
+               so no two workers get the same row
+    ack()      mark delivered rows sent, together with reminder_sent /
+               reminders.sent on their source rows
+    release()  give a failed row back with a backoff, or give up on it
+               after MAX_ATTEMPTS or a permanent refusal
+
+A worker that dies keeps its rows only until the lease runs out; after
+that another worker reclaims them. A row whose lease expires while its
+send is still in flight can be sent twice, so LEASE_SECONDS should be
+well above the time a batch takes.
+
+claim_digests() leases whole recipients instead of rows, so a guardian
+with several doses due (twins, or the five doses at two months) gets one
+digest email per run.
+
+Usage: python -m lib.outbox [--worker NAME] [--batch-size N] [--concurrency N] [--digest] [--enqueue-only]
+"""
+import argparse
+import os
+import smtplib
+import socket
+import textwrap
+import time
+from datetime import date, datetime, timedelta
+
+from lib.db import connection, unit_of_work, placeholders
+
+from lib.scheduling import REMINDER_LEAD_DAYS
+from lib.templates import render, footer, vaccine_info
+
+# Days ahead of a dose its email goes out
+EMAIL_LEAD_DAYS = int(os.environ.get("VACCINE_EMAIL_LEAD_DAYS", "3"))
+# Days an unsent reminder is still worth sending; past that its dose has
+# been and gone
+REMINDER_WINDOW_DAYS = int(os.environ.get("VACCINE_REMINDER_WINDOW_DAYS", str(REMINDER_LEAD_DAYS)))
+LEASE_SECONDS = 300
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 60
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _with_info(language, text, vaccine_name, description):
+    return f"{text}\n\n{vaccine_info(language, vaccine_name, description)}"
+
+
+def dose_email(language, child_name, vaccine_name, scheduled_date, description):
+    return (render("dose_subject", language, child=child_name, vaccine=vaccine_name),
+            _with_info(language, render("dose_body", language, child=child_name, vaccine=vaccine_name,
+                                        date=scheduled_date), vaccine_name, description))
+
+
+def reminder_email(language, child_name, vaccine_name, message, description):
+    return (render("dose_subject", language, child=child_name, vaccine=vaccine_name),
+            _with_info(language, message, vaccine_name, description))
+
+
+def enqueue_due(today=None, lead_days=None, reminder_window_days=None):
+    """
+    Queue the emails due by `today`: scheduled doses from today to
+    `lead_days` ahead whose reminder hasn't been sent, and unsent
+    reminders dated from `reminder_window_days` ago to today, written in
+    each guardian's language. Each is one range scan, of
+    idx_child_vaccines_status_date and idx_reminders_sent_date; rows
+    already in the outbox are skipped. Returns the number of rows queued.
+    """
+    today = today or date.today()
+    lead_days = EMAIL_LEAD_DAYS if lead_days is None else lead_days
+    reminder_window_days = REMINDER_WINDOW_DAYS if reminder_window_days is None else reminder_window_days
+    with unit_of_work() as conn:
+        doses = conn.execute("""
+            SELECT cv.id, u.email, u.language, c.name, v.name, cv.scheduled_date, v.description
+            FROM child_vaccines cv
+            JOIN children c ON cv.child_id = c.id
+            JOIN users u ON c.user_id = u.id
+            JOIN vaccines v ON cv.vaccine_id = v.id
+            WHERE cv.status = 'scheduled' AND cv.reminder_sent = 0
+              AND cv.scheduled_date BETWEEN ? AND ?
+              AND NOT EXISTS (SELECT 1 FROM outbox o WHERE o.kind = 'dose' AND o.source_id = cv.id)
+        """, (today, today + timedelta(days=lead_days))).fetchall()
+        reminders = conn.execute("""
+            SELECT r.id, u.email, u.language, c.name, v.name, r.message, v.description
+            FROM reminders r
+            JOIN child_vaccines cv ON r.child_vaccine_id = cv.id
+            JOIN children c ON cv.child_id = c.id
+            JOIN users u ON c.user_id = u.id
+            JOIN vaccines v ON cv.vaccine_id = v.id
+            WHERE r.sent = 0 AND r.reminder_date BETWEEN ? AND ?
+              AND NOT EXISTS (SELECT 1 FROM outbox o WHERE o.kind = 'reminder' AND o.source_id = r.id)
+        """, (today - timedelta(days=reminder_window_days), today)).fetchall()
+
+        rows = [("dose", row[0], row[1], row[2]) + dose_email(*row[2:]) for row in doses]
+        rows.extend(("reminder", row[0], row[1], row[2]) + reminder_email(*row[2:]) for row in reminders)
+        return conn.executemany("""
+            INSERT OR IGNORE INTO outbox (kind, source_id, recipient, language, subject, body)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows).rowcount
+
+
+def _lease(conn, where, params, worker, until):
+    # Runs in the transaction that selected the rows: its write lock keeps
+    # the set matching `where` the same, so no UPDATE ... RETURNING (SQLite
+    # 3.35+) is needed
+    conn.execute(f"""
+        UPDATE outbox
+        SET lease_owner = ?, available_at = ?, attempts = attempts + 1
+        WHERE {where}
+    """, (worker, until) + params)
+
+
+def claim(worker, limit=BATCH_SIZE, lease_seconds=LEASE_SECONDS, now=None):
+    """
+    Lease up to `limit` claimable rows (pending, with no live lease) to
+    `worker`. Returns [(id, recipient, language, subject, body), ...].
+    """
+    now = time.time() if now is None else now
+    claimable = """
+        SELECT id FROM outbox
+        WHERE status = 'pending' AND available_at <= ?
+        ORDER BY available_at, id
+        LIMIT ?
+    """
+    with unit_of_work() as conn:
+        rows = conn.execute(f"""
+            SELECT id, recipient, language, subject, body FROM outbox
+            WHERE id IN ({claimable})
+        """, (now, limit)).fetchall()
+        if rows:
+            _lease(conn, f"id IN ({claimable})", (now, limit), worker, now + lease_seconds)
+        return sorted(rows)
+
+
+def claim_digests(worker, limit=BATCH_SIZE, lease_seconds=LEASE_SECONDS, now=None):
+    """
+    Lease every claimable row of up to `limit` recipients to `worker`, so
+    each recipient's emails can go out as one digest. Returns
+    [(recipient, language, [(id, subject, body), ...]), ...].
+    """
+    now = time.time() if now is None else now
+    claimable = """
+        status = 'pending' AND available_at <= ? AND recipient IN (
+            SELECT recipient FROM outbox
+            WHERE status = 'pending' AND available_at <= ?
+            GROUP BY recipient
+            ORDER BY MIN(available_at), MIN(id)
+            LIMIT ?
+        )
+    """
+    with unit_of_work() as conn:
+        rows = conn.execute(f"""
+            SELECT recipient, id, language, subject, body FROM outbox WHERE {claimable}
+        """, (now, now, limit)).fetchall()
+        if rows:
+            _lease(conn, claimable, (now, now, limit), worker, now + lease_seconds)
+        digests = {}
+        for recipient, id, language, subject, body in sorted(rows):
+            digests.setdefault((recipient, language), []).append((id, subject, body))
+        return [(recipient, language, items) for (recipient, language), items in digests.items()]
+
+
+def digest_email(items, language):
+    """One (subject, body) covering several outbox emails to the same person."""
+    if len(items) == 1:
+        return items[0][1:]
+    entries = "\n\n".join("- " + textwrap.indent(body, "  ")[2:] for _, _, body in items)
+    return (render("digest_subject", language, count=len(items)),
+            f"{render('digest_intro', language)}\n\n{entries}")
+
+
+def ack(ids):
+    """
+    Mark delivered rows sent and flag their source rows. Rows another
+    worker has already acknowledged are left alone. Returns the number of
+    rows marked.
+    """
+    if not ids:
+        return 0
+    ids = list(ids)
+    with unit_of_work() as conn:
+        pending = f"id IN ({placeholders(ids)}) AND status = 'pending'"
+        marked = conn.execute(f"SELECT kind, source_id FROM outbox WHERE {pending}", ids).fetchall()
+        conn.execute(f"""
+            UPDATE outbox SET status = 'sent', sent_at = ?, lease_owner = NULL, last_error = NULL
+            WHERE {pending}
+        """, [datetime.now()] + ids)
+        doses = [source_id for kind, source_id in marked if kind == "dose"]
+        reminders = [source_id for kind, source_id in marked if kind == "reminder"]
+        if doses:
+            conn.execute(f"UPDATE child_vaccines SET reminder_sent = 1 WHERE id IN ({placeholders(doses)})", doses)
+        if reminders:
+            conn.execute(f"UPDATE reminders SET sent = 1 WHERE id IN ({placeholders(reminders)})", reminders)
+    return len(marked)
+
+
+def release(id, error, permanent=False, now=None):
+    """
+    Hand a row that failed to send back to the queue, claimable again
+    after a backoff that grows with each attempt. A permanent failure, or
+    the MAX_ATTEMPTS-th, marks the row failed instead.
+    """
+    now = time.time() if now is None else now
+    with unit_of_work() as conn:
+        conn.execute("""
+            UPDATE outbox
+            SET status = CASE WHEN ? OR attempts >= ? THEN 'failed' ELSE 'pending' END,
+                available_at = ? + attempts * ?,
+                lease_owner = NULL,
+                last_error = ?
+            WHERE id = ? AND status = 'pending'
+        """, (permanent, MAX_ATTEMPTS, now, RETRY_BACKOFF_SECONDS, str(error), id))
+
+
+def is_permanent(error):
+    # A 5xx refusal will be refused again; a 4xx one may go through later
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return getattr(error, "smtp_code", 500) >= 500
+
+
+def _claim_messages(worker, batch_size, lease_seconds, digest):
+    # [(outbox ids, recipient, subject, body), ...], with the footer added
+    if digest:
+        messages = [(tuple(id for id, _, _ in items), recipient, language) + digest_email(items, language)
+                    for recipient, language, items in claim_digests(worker, batch_size, lease_seconds)]
+    else:
+        messages = [((id,), recipient, language, subject, body)
+                    for id, recipient, language, subject, body in claim(worker, batch_size, lease_seconds)]
+    return [(ids, recipient, subject, f"{body}\n\n-- \n{footer(language)}")
+            for ids, recipient, language, subject, body in messages]
+
+
+def drain(worker=None, mailer=None, concurrency=1, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS,
+          digest=False):
+    """
+    Claim and send batches until nothing claimable is left. Each batch
+    goes over one SMTP session (`mailer`, default a new Mailer), or over
+    `concurrency` sessions (see lib/dispatch.py). With `digest`, each
+    recipient gets one email covering all of their claimable rows, and
+    `batch_size` counts recipients. Returns (sent, failed) in emails.
+    """
+    from lib.mailer import Mailer, MESSAGE_ERRORS
+
+    worker = worker or default_worker_name()
+    sent = failed = 0
+    own_mailer = mailer is None and concurrency <= 1
+    if own_mailer:
+        mailer = Mailer()
+    try:
+        while True:
+            batch = _claim_messages(worker, batch_size, lease_seconds, digest)
+            if not batch:
+                break
+            delivered = []
+
+            def record(message, error):
+                nonlocal sent, failed
+                ids = message[0]
+                if error is None:
+                    sent += 1
+                    delivered.extend(ids)
+                else:
+                    failed += 1
+                    print(f"Failed to send reminder to {message[1]}: {error}")
+                    for id in ids:
+                        release(id, error, permanent=is_permanent(error))
+
+            try:
+                if concurrency > 1:
+                    from lib.dispatch import run_dispatch
+                    run_dispatch(batch, concurrency=concurrency,
+                                 transport_factory=lambda: _OutboxTransport(Mailer()), on_result=record)
+                else:
+                    for row in batch:
+                        try:
+                            mailer.send(*row[1:])
+                        except MESSAGE_ERRORS as e:
+                            record(row, e)
+                            continue
+                        record(row, None)
+            finally:
+                # Whatever went out before an abort must not be sent again
+                ack(delivered)
+    finally:
+        if own_mailer:
+            mailer.close()
+    return sent, failed
+
+
+class _OutboxTransport:
+    # Sends whole outbox rows, so dispatch results keep their ids
+    def __init__(self, mailer):
+        self.mailer = mailer
+
+    def send(self, ids, to, subject, body):
+        self.mailer.send(to, subject, body)
+
+    def close(self):
+        self.mailer.close()
+
+
+def pending_count():
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue due reminder emails and send them from the outbox.")
+    parser.add_argument("--worker", help="lease owner name (default host:pid)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel SMTP sessions per batch")
+    parser.add_argument("--digest", action="store_true", help="one email per guardian covering all their reminders")
+    parser.add_argument("--enqueue-only", action="store_true", help="queue due emails without sending")
+    args = parser.parse_args()
+
+    print(f"Queued {enqueue_due()} emails")
+    if args.enqueue_only:
+        return
+    sent, failed = drain(args.worker, concurrency=args.concurrency, batch_size=args.batch_size, digest=args.digest)
+    print(f"Sent {sent}, {failed} failed, {pending_count()} still pending")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# lib/rules.py
+"""
+Vaccine schedule rules.
+
+Each Vaccine row is one dose of a series (doses sharing a name, in
+dose_number order) and carries these rules:
+
+    recommended_age_months  when the dose is normally given
+    min_age_days            earliest age for an accelerated catch-up dose
+                            (default: the recommended age)
+    min_interval_days       minimum days after the previous dose of the series
+    max_age_days            latest age the dose may be given. A dose with a
+                            maximum age is caught up as soon as allowed once
+                            its recommended date has passed; a dose without
+                            one is skipped when missed
+
+compile_rules() turns a catalog into ScheduleRules. All ages and dates are
+handled as day offsets from birth, so the schedule of a child with no doses
+yet depends only on the child's age and is precomputed for every age up to
+the point where no dose can still be given. Looking up what a child should
+be scheduled for is then a list index.
+"""
+
+DAYS_PER_MONTH = 30
+
+
+class DoseRule:
+    """The rules of one dose (one Vaccine row), in days from birth."""
+
+    __slots__ = ("vaccine", "vaccine_id", "series", "dose_number", "recommended_day",
+                 "min_age_day", "max_age_day", "min_interval_days")
+
+    def __init__(self, vaccine):
+        # A private copy: compiled rules are shared through compile_rules()
+        self.vaccine = vaccine.copy()
+        self.vaccine_id = vaccine.id
+        self.series = vaccine.name
+        self.dose_number = vaccine.dose_number
+        self.recommended_day = vaccine.recommended_age_months * DAYS_PER_MONTH
+        if vaccine.min_age_days is None:
+            self.min_age_day = self.recommended_day
+        else:
+            self.min_age_day = min(vaccine.min_age_days, self.recommended_day)
+        self.max_age_day = vaccine.max_age_days
+        self.min_interval_days = vaccine.min_interval_days or 0
+
+    def __repr__(self):
+        return f"<DoseRule {self.series} dose {self.dose_number} (day {self.recommended_day})>"
+
+    @property
+    def catch_up(self):
+        return self.max_age_day is not None
+
+
+def rule_key(vaccine):
+    # Everything about a vaccine that affects scheduling
+    return (vaccine.id, vaccine.name, vaccine.dose_number, vaccine.recommended_age_months,
+            vaccine.min_age_days, vaccine.max_age_days, vaccine.min_interval_days)
+
+
+def plan_series(rules, history, age, include_missed=False):
+    """
+    Plan the doses of one series (`rules` in dose order) that a child aged
+    `age` days still needs. `history` maps the vaccine ids already given or
+    scheduled to their day offset from birth (None if unknown). Returns
+    (rule, day) pairs with day >= age, plus the missed doses that have no
+    catch-up window (day < age) when `include_missed` is set. A dose that
+    can no longer be given within its maximum age ends the series.
+    """
+    planned = []
+    previous = None
+    behind = False
+    for rule in rules:
+        if rule.vaccine_id in history:
+            given = history[rule.vaccine_id]
+            previous = rule.recommended_day if given is None else given
+            continue
+        # A series that is behind continues on the accelerated schedule
+        day = rule.min_age_day if behind else rule.recommended_day
+        if previous is not None:
+            day = max(day, previous + rule.min_interval_days)
+        if day < age:
+            if not rule.catch_up:
+                if include_missed:
+                    planned.append((rule, day))
+                # Later doses keep their spacing from where this one was due
+                previous = day
+                continue
+            day = age
+            behind = True
+        if rule.max_age_day is not None and day > rule.max_age_day:
+            # Too late for this dose, so the rest of the series can't follow
+            break
+        planned.append((rule, day))
+        previous = day
+    return planned
+
+
+class ScheduleRules:
+    """
+    A catalog compiled into a lookup table:
+
+    plan_table[age]  (rule, day) pairs a child aged `age` days with no doses
+                     yet should be scheduled for
+
+    Ages at or beyond `horizon` share the last entry of the table.
+    """
+
+    def __init__(self, vaccines):
+        self.rules = [DoseRule(vaccine) for vaccine in vaccines]
+        self.by_vaccine_id = {rule.vaccine_id: rule for rule in self.rules}
+        self.series = {}
+        for rule in sorted(self.rules, key=lambda r: (r.dose_number, r.recommended_day, r.vaccine_id)):
+            self.series.setdefault(rule.series, []).append(rule)
+
+        # Past the horizon every dose is either due already or out of its window
+        self.horizon = 0
+        for rules in self.series.values():
+            latest = 0
+            for rule in rules:
+                latest = max(latest + rule.min_interval_days, rule.recommended_day, rule.max_age_day or 0)
+            self.horizon = max(self.horizon, latest + 1)
+
+        self.plan_table = [self._plan_fresh(age) for age in range(self.horizon + 1)]
+
+    def _plan_fresh(self, age):
+        planned = []
+        for rules in self.series.values():
+            planned.extend(plan_series(rules, {}, age))
+        planned.sort(key=lambda pair: pair[1])
+        return tuple(planned)
+
+    def plan(self, age, history=None, include_missed=False):
+        """
+        (rule, day) pairs a child aged `age` days still needs, given the
+        `history` of doses already given or scheduled (see plan_series).
+        """
+        if not history and not include_missed:
+            return self.plan_table[min(age, self.horizon)]
+        planned = []
+        for rules in self.series.values():
+            planned.extend(plan_series(rules, history or {}, age, include_missed))
+        planned.sort(key=lambda pair: pair[1])
+        return planned
+
+
+_compiled = {}
+
+
+def compile_rules(vaccines):
+    """Compile (or reuse the compiled) ScheduleRules for a list of vaccines."""
+    vaccines = list(vaccines)
+    key = tuple(rule_key(vaccine) for vaccine in vaccines)
+    rules = _compiled.get(key)
+    if rules is None:
+        # A handful of catalogs at most are in use at once
+        if len(_compiled) >= 8:
+            _compiled.clear()
+        rules = _compiled[key] = ScheduleRules(vaccines)
+        rules.key = hash(key)
+    return rules
@@ -0,0 +1,406 @@
+# lib/scheduling.py
+from .db import unit_of_work, connection, placeholders, sql_day_number, sql_date, sql_iso_date
+from .models.vaccine import Vaccine
+from .models.child import Child
+from .models.child_vaccine import ChildVaccine
+from .models.reminder import Reminder
+from .rules import DAYS_PER_MONTH, compile_rules
+from .templates import DEFAULT_LANGUAGE, render, sql_render
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+REMINDER_LEAD_DAYS = 7
+# Children scheduled per transaction by schedule_population()
+POPULATION_CHUNK_SIZE = 5000
+
+
+def scheduled_date_for(date_of_birth, vaccine):
+    """Date a vaccine is normally due, counting recommended months as 30 days"""
+    return date_of_birth + timedelta(days=vaccine.recommended_age_months * DAYS_PER_MONTH)
+
+
+def reminder_date_for(scheduled_date):
+    """Date the reminder for a dose goes out (1 week before)"""
+    return scheduled_date - timedelta(days=REMINDER_LEAD_DAYS)
+
+
+def reminder_message(child, vaccine, scheduled_date, language=DEFAULT_LANGUAGE):
+    return render("reminder", language, child=child.name, vaccine=vaccine.name, date=scheduled_date)
+
+
+def _age_days(date_of_birth, today):
+    return max((today - date_of_birth).days, 0)
+
+
+def _history_days(date_of_birth, history):
+    # Dose history as day offsets from birth, as the rules expect; a plain
+    # set of vaccine ids means the dates are unknown
+    if isinstance(history, dict):
+        return {
+            vaccine_id: None if given is None else (given - date_of_birth).days
+            for vaccine_id, given in history.items()
+        }
+    return dict.fromkeys(history)
+
+
+def due_doses(child, vaccines, today=None, history=(), include_missed=False):
+    """
+    Return (vaccine, scheduled_date) for every dose the child still needs
+    under the series rules (see lib/rules.py), given the doses in `history`
+    ({vaccine_id: date given or scheduled}, or a set of vaccine ids).
+    Missed doses without a catch-up window are left out unless
+    `include_missed` is set, since a schedule cannot be created in the past.
+    """
+    today = today or date.today()
+    rules = compile_rules(vaccines)
+    dob = child.date_of_birth
+    planned = rules.plan(_age_days(dob, today), _history_days(dob, history), include_missed)
+    return [(rule.vaccine.copy(), dob + timedelta(days=day)) for rule, day in planned]
+
+
+def plan_child(child, vaccines, scheduled=(), today=None, language=DEFAULT_LANGUAGE):
+    """
+    Work out the doses missing from a child's schedule without touching
+    the database. `scheduled` is the child's dose history as for
+    due_doses(), and reminder messages are written in the guardian's
+    `language`. Returns (child_id, vaccine_id, scheduled_date,
+    reminder_date, message) tuples; reminder_date and message are None
+    when the reminder would fall in the past.
+    """
+    today = today or date.today()
+    plans = []
+    for vaccine, scheduled_date in due_doses(child, vaccines, today, scheduled):
+        reminder_date = reminder_date_for(scheduled_date)
+        if reminder_date >= today:
+            plans.append((child.id, vaccine.id, scheduled_date, reminder_date,
+                          reminder_message(child, vaccine, scheduled_date, language)))
+        else:
+            plans.append((child.id, vaccine.id, scheduled_date, None, None))
+    return plans
+
+
+def save_plans(plans):
+    """
+    Write planned doses from plan_child() and their reminders with two
+    batched inserts in one transaction. Returns the new ChildVaccine objects.
+    """
+    with unit_of_work():
+        child_vaccines = ChildVaccine.bulk_create(
+            [(child_id, vaccine_id, scheduled_date) for child_id, vaccine_id, scheduled_date, _, _ in plans]
+        )
+        Reminder.bulk_create([
+            (child_vaccine.id, reminder_date, message)
+            for child_vaccine, (_, _, _, reminder_date, message) in zip(child_vaccines, plans)
+            if reminder_date is not None
+        ])
+    return child_vaccines
+
+
+def schedule_child(child, vaccines=None):
+    """
+    Bring a child's schedule up to date with the vaccine catalog.
+
+    The child's dose history is read with one query and only the missing
+    doses are written, together with their reminders, in two batched
+    inserts, so the cost does not grow with the catalog size.
+    Returns the newly created ChildVaccine objects.
+    """
+    if vaccines is None:
+        vaccines = Vaccine.get_all()
+
+    with unit_of_work():
+        history = ChildVaccine.find_dose_dates_by_child_id(child.id)
+        language = Child.find_languages_by_ids([child.id]).get(child.id, DEFAULT_LANGUAGE)
+        return save_plans(plan_child(child, vaccines, history, language=language))
+
+
+def _load_plan_table(conn, rules):
+    # Copy rules.plan_table into a temp table so SQL can look a child's
+    # schedule up by age; done once per connection and catalog
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS schedule_plan (
+            age_day INTEGER NOT NULL,
+            vaccine_id INTEGER NOT NULL,
+            series TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            PRIMARY KEY (age_day, vaccine_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS schedule_plan_version (key INTEGER NOT NULL)")
+    row = conn.execute("SELECT key FROM temp.schedule_plan_version").fetchone()
+    if row is not None and row[0] == rules.key:
+        return
+    conn.execute("DELETE FROM temp.schedule_plan")
+    conn.execute("DELETE FROM temp.schedule_plan_version")
+    conn.executemany(
+        "INSERT INTO temp.schedule_plan (age_day, vaccine_id, series, day) VALUES (?, ?, ?, ?)",
+        ((age, rule.vaccine_id, rule.series, day)
+         for age, planned in enumerate(rules.plan_table) for rule, day in planned),
+    )
+    conn.execute("INSERT INTO temp.schedule_plan_version (key) VALUES (?)", (rules.key,))
+
+
+def schedule_children_between(low_id, high_id, vaccines, today=None, fresh_only=False):
+    """
+    Schedule every child with low_id < id <= high_id against `vaccines` in
+    one transaction and return (schedules created, reminders created).
+
+    Children that already have doses are planned one by one against their
+    history. For every other child and series the schedule only depends
+    on the child's age, so it is looked up in the compiled plan table and
+    written with two INSERT ... SELECT statements, without building
+    per-dose Python objects. With `fresh_only`, only series a child has
+    no dose of are scheduled. Follows the same rules as schedule_child().
+    """
+    if not vaccines:
+        return 0, 0
+    today = today or date.today()
+    rules = compile_rules(vaccines)
+    age_day = f"MIN(MAX(? - {sql_day_number('c.date_of_birth')}, 0), {rules.horizon})"
+    due_day = f"{sql_day_number('c.date_of_birth')} + p.day"
+    scheduled_day = sql_day_number("cv.scheduled_date")
+    schedules = reminders = 0
+
+    with unit_of_work() as conn:
+        if not fresh_only:
+            history = ChildVaccine.find_dose_dates_by_child_range(low_id, high_id)
+            languages = Child.find_languages_by_id_range(low_id, high_id)
+            plans = []
+            for child in Child.find_by_ids(history).values():
+                plans.extend(plan_child(child, vaccines, history[child.id], today,
+                                        languages.get(child.id, DEFAULT_LANGUAGE)))
+            schedules += len(save_plans(plans))
+            reminders += sum(1 for plan in plans if plan[3] is not None)
+
+        _load_plan_table(conn, rules)
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM child_vaccines").fetchone()[0]
+        schedules += conn.execute(f"""
+            INSERT INTO child_vaccines (child_id, vaccine_id, scheduled_date, status, reminder_sent, created_at)
+            SELECT c.id, p.vaccine_id, {sql_date(due_day)}, 'scheduled', 0, ?
+            FROM children c
+            JOIN temp.schedule_plan p ON p.age_day = {age_day}
+            WHERE c.id > ? AND c.id <= ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM child_vaccines existing
+                  JOIN vaccines v ON v.id = existing.vaccine_id
+                  WHERE existing.child_id = c.id AND v.name = p.series
+              )
+            ORDER BY c.id, p.day
+        """, (datetime.now(), today.toordinal(), low_id, high_id)).rowcount
+
+        reminders += conn.execute(f"""
+            INSERT INTO reminders (child_vaccine_id, reminder_date, message, sent, created_at)
+            SELECT cv.id, {sql_date(f"{scheduled_day} - {REMINDER_LEAD_DAYS}")},
+                   {sql_render("reminder", "u.language", child="c.name", vaccine="v.name",
+                               date=sql_iso_date(scheduled_day))},
+                   0, ?
+            FROM child_vaccines cv
+            JOIN children c ON c.id = cv.child_id
+            JOIN users u ON u.id = c.user_id
+            JOIN vaccines v ON v.id = cv.vaccine_id
+            WHERE cv.id > ? AND {scheduled_day} - {REMINDER_LEAD_DAYS} >= ?
+            ORDER BY cv.id
+        """, (datetime.now(), last_id, today.toordinal())).rowcount
+    return schedules, reminders
+
+
+def schedule_population(vaccines=None, after_id=0, chunk_size=POPULATION_CHUNK_SIZE, today=None, progress=None,
+                        fresh_only=False):
+    """
+    Bring every child's schedule up to date with the vaccine catalog, for
+    registry backfills.
+
+    Children are processed in id order, `chunk_size` at a time, each chunk
+    in its own transaction so a long run never holds the write lock for
+    long and finished chunks stay saved if it is interrupted; pass the
+    last reported id as `after_id` to resume. `progress(last_id, schedules,
+    reminders)` is called after each chunk. `fresh_only` is passed on to
+    schedule_children_between(). Returns the totals as (schedules created,
+    reminders created).
+    """
+    if vaccines is None:
+        vaccines = Vaccine.get_all()
+    total_schedules = total_reminders = 0
+    while True:
+        with connection() as conn:
+            cursor = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM children WHERE id > ? ORDER BY id LIMIT ?)",
+                (after_id, chunk_size),
+            )
+            high_id = cursor.fetchone()[0]
+        if high_id is None:
+            break
+        schedules, reminders = schedule_children_between(after_id, high_id, vaccines, today, fresh_only)
+        total_schedules += schedules
+        total_reminders += reminders
+        after_id = high_id
+        if progress is not None:
+            progress(after_id, schedules, reminders)
+    return total_schedules, total_reminders
+
+
+def _apply_moves(conn, moves, today):
+    """
+    Move doses to new dates in place. `moves` holds (child_vaccine_id,
+    old_date, new_date); a dose whose new date has passed becomes
+    overdue. Unsent reminders shift by the same number of days and the
+    date in their message is rewritten; one that would now fall before
+    `today` is deleted, as schedule_child() never plans a reminder in the
+    past. Returns (doses, reminders) moved.
+    """
+    if not moves:
+        return 0, 0
+    reminder_day = sql_day_number("reminders.reminder_date")
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS reschedule_moves (
+            child_vaccine_id INTEGER PRIMARY KEY,
+            old_day INTEGER NOT NULL,
+            new_day INTEGER NOT NULL
+        )
+    """)
+    conn.execute("DELETE FROM temp.reschedule_moves")
+    conn.executemany(
+        "INSERT INTO temp.reschedule_moves (child_vaccine_id, old_day, new_day) VALUES (?, ?, ?)",
+        ((id, old_date.toordinal(), new_date.toordinal()) for id, old_date, new_date in moves),
+    )
+    # Correlated primary-key lookups rather than UPDATE ... FROM, which
+    # needs SQLite 3.33
+    move = "FROM temp.reschedule_moves m WHERE m.child_vaccine_id = {}"
+    conn.execute(f"""
+        DELETE FROM reminders
+        WHERE sent = 0 AND child_vaccine_id IN (SELECT child_vaccine_id FROM temp.reschedule_moves)
+          AND (SELECT {reminder_day} + m.new_day - m.old_day {move.format("reminders.child_vaccine_id")}) < ?
+    """, (today.toordinal(),))
+    reminders = conn.execute(f"""
+        UPDATE reminders
+        SET reminder_date = (
+                SELECT {sql_date(f"{reminder_day} + m.new_day - m.old_day")}
+                {move.format("reminders.child_vaccine_id")}
+            ),
+            message = (
+                SELECT replace(reminders.message, {sql_iso_date("m.old_day")}, {sql_iso_date("m.new_day")})
+                {move.format("reminders.child_vaccine_id")}
+            )
+        WHERE sent = 0 AND child_vaccine_id IN (SELECT child_vaccine_id FROM temp.reschedule_moves)
+    """).rowcount
+    doses = conn.execute(f"""
+        UPDATE child_vaccines
+        SET scheduled_date = (SELECT {sql_date("m.new_day")} {move.format("child_vaccines.id")}),
+            status = (
+                SELECT CASE WHEN m.new_day < ? THEN 'overdue' ELSE 'scheduled' END
+                {move.format("child_vaccines.id")}
+            )
+        WHERE id IN (SELECT child_vaccine_id FROM temp.reschedule_moves)
+    """, (today.toordinal(),)).rowcount
+    conn.execute("DELETE FROM temp.reschedule_moves")
+    return doses, reminders
+
+
+def reschedule_child(child, today=None):
+    """
+    Bring a child's existing schedule in line with a corrected date of
+    birth. Completed doses are left alone; the rest are re-planned from
+    them and moved in place (and marked overdue if their new date has
+    passed), and doses that are now ahead of the child are added.
+    Returns the delta as
+    {"moved": doses moved, "reminders": reminders moved, "added": doses added}.
+    """
+    today = today or date.today()
+    with unit_of_work() as conn:
+        child_vaccines = ChildVaccine.find_by_child_id(child.id)
+        given = {
+            cv.vaccine_id: cv.completed_date or cv.scheduled_date
+            for cv in child_vaccines if cv.status == "completed"
+        }
+        planned = {
+            vaccine.id: scheduled_date
+            for vaccine, scheduled_date in due_doses(child, Vaccine.get_all(), today, given, include_missed=True)
+        }
+        moves = [
+            (cv.id, cv.scheduled_date, planned[cv.vaccine_id])
+            for cv in child_vaccines
+            if cv.status != "completed" and cv.vaccine_id in planned
+            and planned[cv.vaccine_id] != cv.scheduled_date
+        ]
+        moved, reminders = _apply_moves(conn, moves, today)
+        added = len(schedule_child(child))
+    return {"moved": moved, "reminders": reminders, "added": added}
+
+
+def reschedule_vaccine(vaccine, today=None, previous_name=None):
+    """
+    Bring every child's schedule in line with changed rules for `vaccine`.
+    Only doses of its series are read or touched: children with doses of
+    the series are re-planned from their completed doses in one
+    transaction, then children with none get the series if any of it is
+    now ahead of them, POPULATION_CHUNK_SIZE children per transaction.
+    When the vaccine was renamed, pass its old name as `previous_name` so
+    the series it left is re-planned too. Returns the same delta as
+    reschedule_child().
+    """
+    today = today or date.today()
+    delta = {"moved": 0, "reminders": 0, "added": 0}
+    names = [vaccine.name]
+    if previous_name is not None and previous_name != vaccine.name:
+        names.append(previous_name)
+    for name in names:
+        series = Vaccine.find_series(name)
+        if not series:
+            continue
+        moved, reminders, added = _reschedule_series(series, today)
+        delta["moved"] += moved
+        delta["reminders"] += reminders
+        delta["added"] += added + schedule_population(series, today=today, fresh_only=True)[0]
+    return delta
+
+
+def _reschedule_series(series, today):
+    # Re-plan the children that have doses of `series`; returns
+    # (doses moved, reminders moved, doses added)
+    rules = compile_rules(series)
+    ids = [v.id for v in series]
+    with unit_of_work() as conn:
+        rows = conn.execute(f"""
+            SELECT cv.child_id, c.date_of_birth, cv.id, cv.vaccine_id, cv.scheduled_date,
+                   cv.completed_date, cv.status
+            FROM child_vaccines cv
+            JOIN children c ON c.id = cv.child_id
+            WHERE cv.vaccine_id IN ({placeholders(ids)})
+            ORDER BY cv.child_id
+        """, ids).fetchall()
+
+        moves = []
+        missing = {}
+        for child_id, doses in groupby(rows, key=itemgetter(0)):
+            doses = list(doses)
+            dob = doses[0][1]
+            existing = {dose[3]: dose for dose in doses}
+            given = {
+                dose[3]: dose[5] or dose[4] for dose in doses if dose[6] == "completed"
+            }
+            planned = rules.plan(_age_days(dob, today), _history_days(dob, given), include_missed=True)
+            for rule, day in planned:
+                new_date = dob + timedelta(days=day)
+                dose = existing.get(rule.vaccine_id)
+                if dose is None:
+                    if new_date >= today:
+                        missing.setdefault(child_id, {})[rule.vaccine_id] = new_date
+                elif new_date != dose[4]:
+                    moves.append((dose[2], dose[4], new_date))
+        moved, reminders = _apply_moves(conn, moves, today)
+
+        plans = []
+        languages = Child.find_languages_by_ids(missing)
+        for child in Child.find_by_ids(missing).values():
+            language = languages.get(child.id, DEFAULT_LANGUAGE)
+            for vaccine_id, scheduled_date in missing[child.id].items():
+                vaccine = rules.by_vaccine_id[vaccine_id].vaccine
+                reminder_date = reminder_date_for(scheduled_date)
+                if reminder_date >= today:
+                    plans.append((child.id, vaccine_id, scheduled_date, reminder_date,
+                                  reminder_message(child, vaccine, scheduled_date, language)))
+                else:
+                    plans.append((child.id, vaccine_id, scheduled_date, None, None))
+        added = len(save_plans(plans))
+    return moved, reminders, added
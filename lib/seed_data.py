@@ -1,10 +1,9 @@
 
-from lib.db import get_db
-from models.vaccine import Vaccine
-from models.user import User
-from models.child import Child
-from models.child_vaccine import ChildVaccine
-from models.reminder import Reminder
+from lib.db import unit_of_work
+from lib.scheduling import schedule_child
+from lib.models.vaccine import Vaccine
+from lib.models.user import User
+from lib.models.child import Child
 from datetime import datetime, date, timedelta
 
 def seed_vaccines():
@@ -17,84 +16,136 @@ def seed_vaccines():
             "description": "Protects against hepatitis B virus infection",
             "recommended_age_months": 0,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": None,
+            "max_age_days": 6570
         },
         {
             "name": "DTaP",
             "description": "Diphtheria, Tetanus, Pertussis vaccine",
             "recommended_age_months": 2,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": 42,
+            "max_age_days": 2555
         },
         {
             "name": "Hib",
             "description": "Haemophilus influenzae type b vaccine",
             "recommended_age_months": 2,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": 42,
+            "max_age_days": 1825
         },
         {
             "name": "IPV",
             "description": "Inactivated Poliovirus vaccine",
             "recommended_age_months": 2,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": 42,
+            "max_age_days": 6570
         },
         {
             "name": "PCV13",
             "description": "Pneumococcal conjugate vaccine",
             "recommended_age_months": 2,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": 42,
+            "max_age_days": 1825
         },
         {
             "name": "Rotavirus",
             "description": "Protects against rotavirus infection",
             "recommended_age_months": 2,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": 42,
+            "max_age_days": 104
         },
         {
             "name": "MMR",
             "description": "Measles, Mumps, Rubella vaccine",
             "recommended_age_months": 12,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": None,
+            "max_age_days": 6570
         },
         {
             "name": "Varicella",
             "description": "Chickenpox vaccine",
             "recommended_age_months": 12,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": None,
+            "max_age_days": 6570
         },
         {
             "name": "Hepatitis A",
             "description": "Protects against hepatitis A virus infection",
             "recommended_age_months": 12,
             "dose_number": 1,
-            "is_required": True
+            "is_required": True,
+            "min_age_days": None,
+            "max_age_days": 6570
         },
         {
             "name": "Meningococcal",
             "description": "Protects against meningococcal disease",
             "recommended_age_months": 12,
             "dose_number": 1,
-            "is_required": False
+            "is_required": False,
+            "min_age_days": None,
+            "max_age_days": None
         }
     ]
     
+    # Later doses of each series: (name, dose_number, recommended_age_months,
+    # min_age_days, min_interval_days); description, requirement and
+    # catch-up window follow the first dose
+    follow_up_doses = [
+        ("Hepatitis B", 2, 1, 28, 28),
+        ("Hepatitis B", 3, 6, 168, 56),
+        ("DTaP", 2, 4, 70, 28),
+        ("DTaP", 3, 6, 98, 28),
+        ("DTaP", 4, 15, 365, 180),
+        ("DTaP", 5, 48, 1460, 180),
+        ("Hib", 2, 4, 70, 28),
+        ("Hib", 3, 12, 365, 56),
+        ("IPV", 2, 4, 70, 28),
+        ("IPV", 3, 6, 98, 28),
+        ("IPV", 4, 48, 1460, 180),
+        ("PCV13", 2, 4, 70, 28),
+        ("PCV13", 3, 6, 98, 28),
+        ("PCV13", 4, 12, 365, 56),
+        ("Rotavirus", 2, 4, 70, 28),
+        ("MMR", 2, 48, 365, 28),
+        ("Varicella", 2, 48, 365, 84),
+        ("Hepatitis A", 2, 18, 545, 180),
+    ]
+    first_doses = {vaccine_data["name"]: vaccine_data for vaccine_data in vaccines_data}
+    for name, dose_number, age_months, min_age_days, min_interval_days in follow_up_doses:
+        vaccines_data.append(dict(
+            first_doses[name],
+            dose_number=dose_number,
+            recommended_age_months=age_months,
+            min_age_days=min_age_days,
+            min_interval_days=min_interval_days,
+        ))
+    # The rotavirus series has to be finished by 8 months
     for vaccine_data in vaccines_data:
-        # Check if vaccine already exists
-        existing = Vaccine.find_by_name(vaccine_data["name"])
-        if not existing:
-            Vaccine.create(
-                vaccine_data["name"],
-                vaccine_data["description"],
-                vaccine_data["recommended_age_months"],
-                vaccine_data["dose_number"],
-                vaccine_data["is_required"]
-            )
+        if vaccine_data["name"] == "Rotavirus" and vaccine_data["dose_number"] == 2:
+            vaccine_data["max_age_days"] = 240
+
+    # Insert the doses that don't already exist in one batch
+    existing_doses = {(vaccine.name, vaccine.dose_number) for vaccine in Vaccine.get_all()}
+    Vaccine.bulk_create([
+        vaccine_data for vaccine_data in vaccines_data
+        if (vaccine_data["name"], vaccine_data["dose_number"]) not in existing_doses
+    ])
     
     print(f"Seeded {len(vaccines_data)} vaccines")
 
@@ -144,26 +195,7 @@ def seed_sample_schedules(child):
     """Seed sample vaccine schedules for the child"""
     print("Seeding sample vaccine schedules...")
     
-    # Get vaccines appropriate for child's age
-    age_months = child.age_in_months
-    vaccines = Vaccine.find_by_age_months(age_months)
-    
-    schedules_created = 0
-    for vaccine in vaccines:
-        # Calculate scheduled date based on recommended age
-        scheduled_date = child.date_of_birth + timedelta(days=vaccine.recommended_age_months * 30)
-        
-        # Only schedule if not already scheduled and date is in the future
-        if scheduled_date >= date.today():
-            child_vaccine = ChildVaccine.create(child.id, vaccine.id, scheduled_date)
-            
-            # Create reminder
-            reminder_date = scheduled_date - timedelta(days=7)  # 1 week before
-            if reminder_date >= date.today():
-                message = f"Reminder: {child.name} is due for {vaccine.name} on {scheduled_date}"
-                Reminder.create(child_vaccine.id, reminder_date, message)
-            
-            schedules_created += 1
+    schedules_created = len(schedule_child(child))
     
     print(f"Created {schedules_created} vaccine schedules")
 
@@ -173,17 +205,19 @@ def seed_all():
     print()
     
     try:
-        seed_vaccines()
-        print()
-        
-        user = seed_sample_user()
-        print()
-        
-        child = seed_sample_child(user)
-        print()
-        
-        seed_sample_schedules(child)
-        print()
+        # One transaction for the whole seed run
+        with unit_of_work():
+            seed_vaccines()
+            print()
+            
+            user = seed_sample_user()
+            print()
+            
+            child = seed_sample_child(user)
+            print()
+            
+            seed_sample_schedules(child)
+            print()
         
         print("Database seeding completed successfully!")
         print()
@@ -196,9 +230,7 @@ def seed_all():
         
     except Exception as e:
         print(f"Error during seeding: {e}")
-        conn, _ = get_db()
-        conn.rollback()
-        conn.close()
+        print("No changes were saved.")
 
 if __name__ == "__main__":
     seed_all()
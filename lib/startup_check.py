@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# lib/startup_check.py
+"""
+Checks that the app starts within its time budget: importing the CLI and
+getting a ready database (schema already current) must stay under
+STARTUP_BUDGET_MS. Exits non-zero when over budget.
+
+Usage: python -m lib.startup_check
+"""
+import os
+import sys
+import time
+
+STARTUP_BUDGET_MS = float(os.environ.get("VACCINE_STARTUP_BUDGET_MS", "150"))
+
+
+def measure():
+    """Return (import_ms, database_ms) for a cold import and first query."""
+    start = time.perf_counter()
+    import lib.cli  # noqa: F401
+    imported = time.perf_counter()
+
+    from lib.db import connection
+    with connection() as conn:
+        conn.execute("SELECT 1").fetchone()
+    ready = time.perf_counter()
+    return (imported - start) * 1000, (ready - imported) * 1000
+
+
+def main():
+    import_ms, database_ms = measure()
+    total_ms = import_ms + database_ms
+    print(f"import: {import_ms:.1f} ms, database ready: {database_ms:.1f} ms, "
+          f"total: {total_ms:.1f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)")
+    return 0 if total_ms <= STARTUP_BUDGET_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# lib/sweeper.py
+"""
+Moves past-due doses from 'scheduled' to 'overdue' so the status column
+agrees with ChildVaccine.is_overdue, and overdue reports can read the
+(status, scheduled_date) index instead of comparing dates row by row.
+
+Runs are incremental: the date swept through is kept in schema_settings,
+so each run only looks at doses that became due since the last one.
+
+Usage: python -m lib.sweeper [--full]
+"""
+import argparse
+from datetime import date
+
+from lib.db import connection, unit_of_work
+
+SWEPT_THROUGH_KEY = "overdue_swept_through"
+
+
+def _swept_through():
+    # The date the last run swept up to, None if it never ran
+    with connection() as conn:
+        row = conn.execute("SELECT value FROM schema_settings WHERE key = ?", (SWEPT_THROUGH_KEY,)).fetchone()
+    return None if row is None else date.fromisoformat(row[0])
+
+
+def sweep_overdue(today=None, full=False):
+    """
+    Mark every scheduled dose dated before `today` overdue with one
+    indexed UPDATE, and put doses rescheduled back into the future to
+    'scheduled'. Only doses dated on or after the last run's date are
+    looked at unless `full` is set. Returns {vaccine_id: doses marked
+    overdue}.
+    """
+    today = today or date.today()
+    if not full:
+        # Checked before taking the write lock too, so repeat runs on the
+        # same day never wait for it
+        swept_through = _swept_through()
+        if swept_through is not None and swept_through >= today:
+            return {}
+    with unit_of_work() as conn:
+        swept_through = None if full else _swept_through()
+        if swept_through is not None and swept_through >= today:
+            return {}
+
+        if swept_through is None:
+            due, params = "status = 'scheduled' AND scheduled_date < ?", (today,)
+        else:
+            due, params = "status = 'scheduled' AND scheduled_date >= ? AND scheduled_date < ?", (swept_through, today)
+        # Counted before the UPDATE rather than with RETURNING (SQLite
+        # 3.35+); the write lock is already held, so both see the same rows
+        counts = dict(conn.execute(
+            f"SELECT vaccine_id, COUNT(*) FROM child_vaccines WHERE {due} GROUP BY vaccine_id", params
+        ))
+        if counts:
+            conn.execute(f"UPDATE child_vaccines SET status = 'overdue' WHERE {due}", params)
+
+        conn.execute("""
+            UPDATE child_vaccines SET status = 'scheduled'
+            WHERE status = 'overdue' AND scheduled_date >= ?
+        """, (today,))
+        conn.execute("""
+            INSERT INTO schema_settings (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        """, (SWEPT_THROUGH_KEY, today.isoformat()))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark past-due vaccine doses overdue.")
+    parser.add_argument("--full", action="store_true", help="re-check every dose, not just those due since the last run")
+    args = parser.parse_args()
+
+    counts = sweep_overdue(full=args.full)
+    if not counts:
+        print("No newly overdue vaccines.")
+        return
+
+    from lib.models.vaccine import Vaccine
+    vaccines = Vaccine.find_by_ids(counts)
+    for vaccine_id, count in sorted(counts.items()):
+        vaccine = vaccines.get(vaccine_id)
+        name = f"{vaccine.name} (dose {vaccine.dose_number})" if vaccine else f"Vaccine {vaccine_id}"
+        print(f"{name}: {count} overdue")
+    print(f"Marked {sum(counts.values())} doses overdue")
+
+
+if __name__ == "__main__":
+    main()
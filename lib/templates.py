@@ -0,0 +1,142 @@
+# lib/templates.py
+"""
+Per-language message templates.
+
+Each supported language has a JSON file in lib/locales/ mapping template
+names to str.format-style text, e.g.
+
+    "reminder": "Reminder: {child} is due for {vaccine} on {date}"
+
+A language's file is read and compiled once per process, the first time
+it is used. Compiling checks each placeholder against the fields its
+template is rendered with (TEMPLATE_FIELDS), so a broken translation
+fails on load rather than halfway through a dispatch run. Templates a
+language leaves out fall back to English. Fragments shared by many
+messages (the footer, a vaccine's description) are rendered once per
+language and cached.
+
+Dates are rendered as YYYY-MM-DD in every language:
+scheduling._apply_moves() finds the date in stored reminder messages.
+"""
+import json
+import os
+import string
+import threading
+from functools import lru_cache
+
+LOCALES_DIR = os.path.join(os.path.dirname(__file__), "locales")
+DEFAULT_LANGUAGE = "en"
+
+# Template name -> the placeholders it may use
+TEMPLATE_FIELDS = {
+    "language_name": (),
+    "reminder": ("child", "vaccine", "date"),
+    "dose_subject": ("child", "vaccine"),
+    "dose_body": ("child", "vaccine", "date"),
+    "vaccine_info": ("vaccine", "description"),
+    "digest_subject": ("count",),
+    "digest_intro": (),
+    "footer": (),
+}
+
+LANGUAGES = tuple(sorted(name[:-len(".json")] for name in os.listdir(LOCALES_DIR) if name.endswith(".json")))
+
+
+class Template:
+    """
+    One compiled template. render(**values) returns the text; sql(**columns)
+    returns the same text as a SQL expression over the given columns.
+    """
+
+    __slots__ = ("name", "language", "text", "_parts")
+
+    def __init__(self, name, language, text):
+        self.name = name
+        self.language = language
+        self.text = text
+        # (literal, None) and (None, field) pieces in order
+        self._parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if literal:
+                self._parts.append((literal, None))
+            if field is None:
+                continue
+            if field not in TEMPLATE_FIELDS[name] or spec or conversion:
+                raise ValueError(f"Unknown placeholder {{{field}}} in template {name!r} ({language})")
+            self._parts.append((None, field))
+
+    def __repr__(self):
+        return f"<Template {self.name} ({self.language})>"
+
+    def render(self, **values):
+        return self.text.format_map(values)
+
+    def sql(self, **columns):
+        pieces = [
+            "'" + literal.replace("'", "''") + "'" if field is None else f"({columns[field]})"
+            for literal, field in self._parts
+        ]
+        return " || ".join(pieces) or "''"
+
+
+_catalogs = {}
+_lock = threading.RLock()
+
+
+def _load(language):
+    with open(os.path.join(LOCALES_DIR, f"{language}.json"), encoding="utf-8") as f:
+        texts = json.load(f)
+    unknown = set(texts) - set(TEMPLATE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown templates in {language}.json: {', '.join(sorted(unknown))}")
+    templates = {} if language == DEFAULT_LANGUAGE else dict(catalog(DEFAULT_LANGUAGE))
+    templates.update((name, Template(name, language, text)) for name, text in texts.items())
+    return templates
+
+
+def catalog(language):
+    """The compiled templates of `language`, or of English if it isn't supported."""
+    if language not in LANGUAGES:
+        language = DEFAULT_LANGUAGE
+    templates = _catalogs.get(language)
+    if templates is None:
+        with _lock:
+            templates = _catalogs.get(language)
+            if templates is None:
+                templates = _catalogs[language] = _load(language)
+    return templates
+
+
+def template(name, language=DEFAULT_LANGUAGE):
+    return catalog(language)[name]
+
+
+def render(name, language=DEFAULT_LANGUAGE, **values):
+    return catalog(language)[name].render(**values)
+
+
+def sql_render(name, language_column, **columns):
+    """
+    SQL expression rendering template `name` in each row's language, read
+    from `language_column`, with placeholders filled from `columns`.
+    """
+    default = template(name).sql(**columns)
+    whens = " ".join(
+        f"WHEN '{language}' THEN {template(name, language).sql(**columns)}"
+        for language in LANGUAGES if language != DEFAULT_LANGUAGE
+    )
+    return f"(CASE {language_column} {whens} ELSE {default} END)" if whens else default
+
+
+def language_name(language):
+    return render("language_name", language)
+
+
+@lru_cache(maxsize=None)
+def footer(language):
+    return render("footer", language)
+
+
+@lru_cache(maxsize=4096)
+def vaccine_info(language, vaccine, description):
+    return render("vaccine_info", language, vaccine=vaccine, description=description)
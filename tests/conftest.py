@@ -0,0 +1,33 @@
+import pytest
+
+from lib import db
+from lib.local_smtp import LocalSMTPServer
+from lib.mailer import Mailer
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A fresh database for one test, created on first use."""
+    previous = db.DB_PATH
+    db.configure(path=str(tmp_path / "test.db"))
+    yield
+    db.configure(path=previous)
+
+
+@pytest.fixture
+def smtp_server():
+    with LocalSMTPServer(reject={"refused@example.org"}) as server:
+        yield server
+
+
+@pytest.fixture
+def mailer_factory(smtp_server):
+    def factory():
+        return Mailer(smtp_server.host, smtp_server.port, "", "", sender="reminders@example.org", starttls=False)
+    return factory
+
+
+@pytest.fixture
+def smtp_mailer(mailer_factory):
+    with mailer_factory() as session:
+        yield session
@@ -0,0 +1,235 @@
+import sqlite3
+import subprocess
+import sys
+import threading
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from lib import db
+from lib.db import ConnectionPool, connection, load_all, load_one, unit_of_work
+from lib.migrations import MIGRATIONS
+from lib.models import Child, User
+
+
+def test_pool_reuses_released_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    assert pool.stats == {"size": 2, "open": 1, "idle": 0}
+
+
+def test_pool_waits_then_times_out_when_exhausted(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+    pool.acquire()
+
+    with pytest.raises(sqlite3.OperationalError, match="Timed out"):
+        pool.acquire()
+
+
+def test_release_rolls_back_an_open_transaction(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn)
+
+    assert pool.acquire().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_closed_pool_refuses_checkouts(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1)
+    pool.release(pool.acquire())
+    pool.close_all()
+
+    assert pool.stats["open"] == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
+
+
+def test_nested_blocks_share_the_thread_connection(database):
+    with connection() as outer:
+        with connection() as inner:
+            assert inner is outer
+
+
+def test_threads_get_their_own_connections(database):
+    seen = []
+
+    def borrow(barrier):
+        with connection() as conn:
+            seen.append(conn)
+            barrier.wait()
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=borrow, args=(barrier,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == 2 and seen[0] is not seen[1]
+
+
+def test_outermost_block_commits_or_rolls_back(database):
+    with connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pytest.raises(RuntimeError):
+        with connection() as conn:
+            conn.execute("INSERT INTO t VALUES (2)")
+            raise RuntimeError
+
+    with connection() as conn:
+        assert conn.execute("SELECT x FROM t").fetchall() == [(1,)]
+
+
+def test_get_db_returns_a_working_connection(database):
+    conn, cursor = db.get_db()
+    try:
+        assert cursor.execute("SELECT COUNT(*) FROM vaccines").fetchone() == (0,)
+    finally:
+        conn.close()
+
+
+def pragmas(conn):
+    return {name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in ("journal_mode", "synchronous", "cache_size", "busy_timeout", "foreign_keys")}
+
+
+def test_connections_get_the_default_profile(tmp_path):
+    conn = db.connect(str(tmp_path / "profile.db"), "default")
+
+    assert pragmas(conn) == {"journal_mode": "wal", "synchronous": 1, "cache_size": -16000,
+                             "busy_timeout": 5000, "foreign_keys": 1}
+
+
+def test_profile_overrides_are_merged_with_the_default(tmp_path):
+    conn = db.connect(str(tmp_path / "profile.db"), {"synchronous": "full", "busy_timeout": 250})
+
+    assert pragmas(conn)["synchronous"] == 2
+    assert pragmas(conn)["busy_timeout"] == 250
+    assert pragmas(conn)["journal_mode"] == "wal"
+
+
+@pytest.mark.parametrize("profile", ["fastest", {"synchronous": "sometimes"}, {"cache_size": "big"}, {"page_size": 1}])
+def test_invalid_profiles_are_refused(profile):
+    with pytest.raises(ValueError):
+        db.resolve_profile(profile)
+
+
+def test_configure_applies_the_profile_to_pooled_connections(database):
+    db.configure(profile="legacy")
+    try:
+        with connection() as conn:
+            assert pragmas(conn)["journal_mode"] == "delete"
+    finally:
+        db.configure(profile="default")
+
+
+def usernames():
+    with connection() as conn:
+        return [row[0] for row in conn.execute("SELECT username FROM users ORDER BY id")]
+
+
+def test_unit_of_work_commits_once_at_the_end(database):
+    with unit_of_work():
+        User.create("amani", "amani@example.org", "password123")
+        User.create("baraka", "baraka@example.org", "password123")
+
+    assert usernames() == ["amani", "baraka"]
+
+
+def test_unit_of_work_rolls_back_everything_on_error(database):
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            User.create("amani", "amani@example.org", "password123")
+            raise RuntimeError
+
+    assert usernames() == []
+
+
+def test_caught_failure_inside_a_connection_block_is_not_committed(database):
+    with connection():
+        try:
+            with unit_of_work():
+                User.create("aaa", "aaa@example.org", "password123")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+    assert usernames() == []
+
+
+def test_nested_unit_of_work_is_a_savepoint(database):
+    with unit_of_work():
+        User.create("amani", "amani@example.org", "password123")
+        try:
+            with unit_of_work():
+                User.create("baraka", "baraka@example.org", "password123")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        User.create("chiku", "chiku@example.org", "password123")
+
+    assert usernames() == ["amani", "chiku"]
+
+
+def test_rows_are_loaded_by_column_name(database):
+    user = User.create("amani", "amani@example.org", "password123")
+    Child.create(user.id, "Zawadi", date(2025, 1, 10), "female")
+
+    with connection() as conn:
+        child = load_one(Child, conn.execute(
+            "SELECT 'extra' AS unknown, gender, date_of_birth, name, id FROM children"))
+
+    assert (child.id, child.name, child.date_of_birth, child.gender) == (1, "Zawadi", date(2025, 1, 10), "female")
+    assert not hasattr(child, "user_id")
+
+
+def test_loading_skips_validators_and_keeps_bad_values(database):
+    user = User.create("amani", "amani@example.org", "password123")
+    with connection() as conn:
+        # Rows the setters would refuse: a one-letter name, an unparseable date
+        conn.execute("INSERT INTO children (user_id, name, date_of_birth, gender) VALUES (?, 'Z', '2025-13-40', 'other')",
+                     (user.id,))
+        conn.execute("INSERT INTO children (user_id, name, date_of_birth, gender) VALUES (?, 'Baraka', '2024-06-01', 'male')",
+                     (user.id,))
+
+    with connection() as conn:
+        children = load_all(Child, conn.execute("SELECT * FROM children ORDER BY id"))
+
+    assert [(c.name, c.date_of_birth) for c in children] == [("Z", "2025-13-40"), ("Baraka", date(2024, 6, 1))]
+
+
+def test_computed_columns_are_decoded_by_the_loader(database):
+    user = User.create("amani", "amani@example.org", "password123")
+    Child.create(user.id, "Zawadi", date(2025, 1, 10), "female")
+
+    with connection() as conn:
+        # No declared type, so sqlite3 hands back text for the loader to decode
+        child = load_one(Child, conn.execute("SELECT id, name, date(date_of_birth, '+1 day') AS date_of_birth FROM children"))
+
+    assert child.date_of_birth == date(2025, 1, 11)
+
+
+def test_init_db_reports_the_migrations_applied_on_first_use(database):
+    with connection() as conn:
+        conn.execute("SELECT 1")
+
+    assert [number for number, _ in db.init_db()] == [number for number, _, _ in MIGRATIONS]
+    assert db.init_db() == []
+
+
+def test_importing_the_cli_does_not_load_the_models():
+    # Run in a fresh interpreter: this test process has already imported everything
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, lib.cli; print(' '.join(sorted(sys.modules)))"],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True,
+    ).stdout.split()
+
+    assert not [name for name in loaded if name.startswith(("lib.models.", "lib.scheduling", "lib.migrations"))]
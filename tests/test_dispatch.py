@@ -0,0 +1,65 @@
+import asyncio
+import smtplib
+import socket
+import time
+
+import pytest
+
+from lib.dispatch import TokenBucket, run_dispatch
+from lib.mailer import Mailer
+
+
+def unlimited(concurrency):
+    return TokenBucket(rate=1e6, burst=concurrency)
+
+
+def messages(count):
+    return [(f"guardian{i}@example.org", "Vaccine Reminder", f"Message {i}") for i in range(count)]
+
+
+def test_sends_every_message_over_concurrent_sessions(smtp_server, mailer_factory):
+    sent, failed = run_dispatch(messages(20), concurrency=4, transport_factory=mailer_factory,
+                                limiter=unlimited(4))
+
+    assert (sent, failed) == (20, 0)
+    assert smtp_server.connections == 4
+    assert sorted(rcpts[0] for _, rcpts, _ in smtp_server.messages) == sorted(to for to, _, _ in messages(20))
+
+
+def test_refused_recipient_fails_and_the_batch_goes_on(smtp_server, mailer_factory):
+    batch = messages(4) + [("refused@example.org", "Vaccine Reminder", "Refused")]
+    results = []
+
+    sent, failed = run_dispatch(batch, concurrency=2, transport_factory=mailer_factory, limiter=unlimited(2),
+                                on_result=lambda message, error: results.append((message[0], error)))
+
+    assert (sent, failed) == (4, 1)
+    assert len(smtp_server.messages) == 4
+    errors = {to: error for to, error in results}
+    assert isinstance(errors.pop("refused@example.org"), smtplib.SMTPRecipientsRefused)
+    assert set(errors.values()) == {None}
+
+
+def test_connection_failure_stops_the_batch():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    def factory():
+        return Mailer("127.0.0.1", port, "", "", sender="reminders@example.org", starttls=False, retries=0)
+
+    with pytest.raises(ConnectionRefusedError):
+        run_dispatch(messages(3), concurrency=2, transport_factory=factory, limiter=unlimited(2))
+
+
+def test_token_bucket_holds_the_rate_after_a_burst():
+    bucket = TokenBucket(rate=20, burst=5)
+
+    async def take(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    asyncio.run(take(15))
+    # 5 at once, then 10 more at 20 per second
+    assert time.monotonic() - started >= 0.45
@@ -0,0 +1,195 @@
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from lib import db
+from lib.migrations import FOREIGN_KEYS_VERSION, MIGRATIONS, current_version, latest_version, migrate, sync_date_storage
+from lib.models import Child, ChildVaccine, User, Vaccine
+
+# The schema as lib/models/__init__.py created it before migrations existed
+BASELINE_SCHEMA = """
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        language TEXT DEFAULT 'en',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE children (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        date_of_birth DATE NOT NULL,
+        gender TEXT CHECK(gender IN ('male', 'female', 'other')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+    CREATE TABLE vaccines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        recommended_age_months INTEGER NOT NULL,
+        dose_number INTEGER DEFAULT 1,
+        is_required BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE child_vaccines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        child_id INTEGER NOT NULL,
+        vaccine_id INTEGER NOT NULL,
+        scheduled_date DATE NOT NULL,
+        completed_date DATE,
+        status TEXT DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'completed', 'overdue')),
+        reminder_sent BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (child_id) REFERENCES children (id),
+        FOREIGN KEY (vaccine_id) REFERENCES vaccines (id)
+    );
+    CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        child_vaccine_id INTEGER NOT NULL,
+        reminder_date DATE NOT NULL,
+        message TEXT NOT NULL,
+        sent BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (child_vaccine_id) REFERENCES child_vaccines (id)
+    );
+"""
+
+
+def baseline_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executescript("""
+        INSERT INTO users (id, username, email, password_hash) VALUES (1, 'amani', 'amani@example.org', 'x');
+        INSERT INTO children (id, user_id, name, date_of_birth, gender) VALUES (1, 1, 'Zawadi', '2025-01-10', 'female');
+        INSERT INTO vaccines (id, name, description, recommended_age_months) VALUES (1, 'BCG', 'Tuberculosis', 0);
+        -- A duplicate schedule row whose second copy is the completed one
+        INSERT INTO child_vaccines (id, child_id, vaccine_id, scheduled_date, status)
+            VALUES (1, 1, 1, '2025-01-10', 'scheduled');
+        INSERT INTO child_vaccines (id, child_id, vaccine_id, scheduled_date, completed_date, status)
+            VALUES (2, 1, 1, '2025-01-10', '2025-01-11', 'completed');
+        INSERT INTO reminders (child_vaccine_id, reminder_date, message) VALUES (1, '2025-01-03', 'BCG due');
+        -- Left behind by a delete before deletes cascaded
+        INSERT INTO reminders (child_vaccine_id, reminder_date, message) VALUES (99, '2025-01-03', 'orphan');
+    """)
+    conn.close()
+
+
+def index_names(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_new_database_is_migrated_to_the_latest_version(tmp_path):
+    conn = db.connect(str(tmp_path / "new.db"))
+
+    applied = migrate(conn)
+
+    assert [number for number, _ in applied] == [number for number, _, _ in MIGRATIONS]
+    assert current_version(conn) == latest_version()
+    assert {"idx_child_vaccines_child_vaccine", "idx_outbox_claim"} <= index_names(conn)
+    assert migrate(conn) == []
+
+
+def test_baseline_database_keeps_its_data(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    baseline_database(path)
+    conn = db.connect(path)
+
+    migrate(conn)
+
+    assert current_version(conn) == latest_version()
+    assert conn.execute("SELECT name FROM children").fetchall() == [("Zawadi",)]
+    # The completed copy is kept and the reminder follows it; the orphan goes
+    assert conn.execute("SELECT id, status FROM child_vaccines").fetchall() == [(2, "completed")]
+    assert conn.execute("SELECT child_vaccine_id, message FROM reminders").fetchall() == [(2, "BCG due")]
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_migrating_to_a_target_stops_there(tmp_path):
+    conn = db.connect(str(tmp_path / "new.db"))
+
+    assert [number for number, _ in migrate(conn, target=3)] == [1, 2, 3]
+    assert current_version(conn) == 3
+    assert [number for number, _ in migrate(conn)][0] == 4
+
+
+def test_concurrent_migrations_apply_each_version_once(tmp_path):
+    path = str(tmp_path / "race.db")
+    results = []
+
+    def run():
+        conn = db.connect(path, check_same_thread=False)
+        results.append(migrate(conn))
+        conn.close()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    applied = sorted(number for result in results for number, _ in result)
+    assert applied == [number for number, _, _ in MIGRATIONS]
+
+
+def test_cascade_migration_stops_rather_than_drop_completed_doses(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    baseline_database(path)
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM vaccines")
+    conn.commit()
+    conn.close()
+    conn = db.connect(path)
+
+    with pytest.raises(sqlite3.IntegrityError, match="1 completed dose"):
+        migrate(conn)
+
+    assert current_version(conn) == FOREIGN_KEYS_VERSION - 1
+    assert conn.execute("SELECT COUNT(*) FROM child_vaccines").fetchone()[0] == 1
+
+
+def stored_dates(conn):
+    # Cast so the DATE converter doesn't decode the stored value
+    return conn.execute("SELECT typeof(date_of_birth), CAST(date_of_birth AS TEXT) FROM children ORDER BY id").fetchall()
+
+
+@pytest.fixture
+def date_storage(database):
+    yield
+    db.configure(date_storage="iso")
+
+
+def test_dates_are_converted_when_the_storage_changes(date_storage):
+    user = User.create("amani", "amani@example.org", "password123")
+    child = Child.create(user.id, "Zawadi", date(2025, 1, 10), "female")
+    vaccine = Vaccine.create("BCG", "Protects against tuberculosis", 0)
+    dose = ChildVaccine.create(child.id, vaccine.id, date.today() + timedelta(days=3))
+
+    db.configure(date_storage="days")
+    with db.connection() as conn:
+        assert stored_dates(conn) == [("integer", str(date(2025, 1, 10).toordinal()))]
+    assert Child.find_by_id(child.id).date_of_birth == date(2025, 1, 10)
+    # Date comparisons in SQL still work on day numbers
+    assert [cv.id for cv in ChildVaccine.find_due_soon(days=7)] == [dose.id]
+
+    db.configure(date_storage="iso")
+    with db.connection() as conn:
+        assert stored_dates(conn) == [("text", "2025-01-10")]
+
+
+def test_unparseable_dates_are_left_as_they_are(date_storage):
+    user = User.create("amani", "amani@example.org", "password123")
+    with db.connection() as conn:
+        conn.execute("INSERT INTO children (user_id, name, date_of_birth, gender) VALUES (?, 'Zawadi', 'unknown', 'other')",
+                     (user.id,))
+
+    db.configure(date_storage="days")
+    with db.connection() as conn:
+        assert stored_dates(conn) == [("text", "unknown")]
+        assert sync_date_storage(conn, "days") is False
+
+    assert Child.find_by_user_id(user.id)[0].date_of_birth == "unknown"
@@ -0,0 +1,266 @@
+from datetime import date, timedelta
+
+import pytest
+
+from lib import db
+from lib.db import connection, insert_many, unit_of_work
+from lib.models import Child, ChildVaccine, Reminder, User, Vaccine
+from lib.models.vaccine import catalog
+
+DOB = date(2025, 1, 10)
+NEXT_WEEK = date.today() + timedelta(days=7)
+
+
+@pytest.fixture
+def guardian(database):
+    return User.create("amani", "amani@example.org", "password123")
+
+
+@pytest.fixture
+def child(guardian):
+    return Child.create(guardian.id, "Zawadi", DOB, "female")
+
+
+@pytest.fixture
+def bcg(database):
+    return Vaccine.create("BCG", "Protects against tuberculosis", 0)
+
+
+def test_bulk_create_sets_the_ids_of_the_inserted_rows(guardian):
+    # A deleted row leaves a gap in the ids before the batch
+    Child.create(guardian.id, "Removed", DOB, "male").delete()
+
+    children = Child.bulk_create([(guardian.id, f"Child {i}", DOB, "female") for i in range(5)])
+
+    assert [Child.find_by_id(c.id).name for c in children] == [f"Child {i}" for i in range(5)]
+
+
+def test_bulk_create_of_schedules_and_reminders(child, bcg):
+    doses = ChildVaccine.bulk_create([(child.id, bcg.id, NEXT_WEEK)])
+    reminders = Reminder.bulk_create([
+        {"child_vaccine_id": doses[0].id, "reminder_date": NEXT_WEEK, "message": "BCG due today"},
+    ])
+
+    assert ChildVaccine.find_by_id(doses[0].id).vaccine_id == bcg.id
+    assert Reminder.find_by_id(reminders[0].id).message == "BCG due today"
+
+
+def test_bulk_create_validates_every_row_before_inserting(guardian):
+    with pytest.raises(ValueError):
+        Child.bulk_create([(guardian.id, "Zawadi", DOB, "female"), (guardian.id, "", DOB, "female")])
+
+    assert Child.find_by_user_id(guardian.id) == []
+
+
+def test_insert_many_returns_ids_in_order(database):
+    with unit_of_work() as conn:
+        ids = insert_many(conn, "INSERT INTO vaccines (name, description, recommended_age_months) VALUES (?, ?, ?)",
+                          [("OPV", "Oral polio", 0), ("Rotavirus", "Rotavirus", 2)])
+        assert insert_many(conn, "INSERT INTO vaccines (name) VALUES (?)", []) == []
+
+    with connection() as conn:
+        rows = conn.execute("SELECT id, name FROM vaccines ORDER BY id").fetchall()
+    assert rows == list(zip(ids, ["OPV", "Rotavirus"]))
+
+
+def test_prefetch_loads_relationships_in_one_query_each(child, bcg):
+    polio = Vaccine.create("Polio", "Oral polio vaccine dose", 2)
+    doses = ChildVaccine.bulk_create([(child.id, bcg.id, NEXT_WEEK), (child.id, polio.id, NEXT_WEEK)])
+    Reminder.create(doses[0].id, NEXT_WEEK, "BCG due today")
+    statements = []
+
+    with connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            loaded = ChildVaccine.find_by_child_id(child.id, include=["child", "vaccine", "reminders"])
+            queries = len(statements)
+            related = [(cv.get_child().name, cv.get_vaccine().name, len(cv.get_reminders())) for cv in loaded]
+        finally:
+            conn.set_trace_callback(None)
+
+    assert queries == 4
+    assert len(statements) == queries
+    assert related == [("Zawadi", "BCG", 1), ("Zawadi", "Polio", 0)]
+    assert loaded[0].get_reminders()[0].get_child_vaccine() is loaded[0]
+
+
+def test_reminder_prefetch_follows_nested_relationships(child, bcg):
+    dose = ChildVaccine.create(child.id, bcg.id, NEXT_WEEK)
+    Reminder.create(dose.id, NEXT_WEEK, "BCG due today")
+
+    reminders = Reminder.find_by_child_vaccine_id(dose.id, include=["child_vaccine.child", "child_vaccine.vaccine"])
+
+    assert reminders[0].get_child_vaccine()._related.keys() == {"child", "vaccine"}
+    assert (reminders[0].get_child().name, reminders[0].get_vaccine().name) == ("Zawadi", "BCG")
+
+
+def test_unknown_relationships_are_refused(child):
+    with pytest.raises(ValueError, match="Unknown ChildVaccine"):
+        ChildVaccine.find_by_child_id(child.id, include=["guardian"])
+    with pytest.raises(ValueError, match="Unknown Reminder"):
+        Reminder.prefetch([], ["child"])
+
+
+def test_catalog_hands_out_copies(bcg):
+    vaccine = Vaccine.find_by_id(bcg.id)
+    vaccine.name = "Edited"
+
+    assert Vaccine.find_by_id(bcg.id).name == "BCG"
+    assert Vaccine.find_by_id(bcg.id) is not Vaccine.find_by_id(bcg.id)
+
+
+def test_catalog_is_refreshed_after_a_save(bcg):
+    Vaccine.get_all()
+    misses = catalog.misses
+
+    bcg.description = "Bacillus Calmette-Guerin"
+    bcg.save()
+
+    assert Vaccine.find_by_id(bcg.id).description == "Bacillus Calmette-Guerin"
+    assert catalog.misses == misses + 1
+
+
+def test_catalog_follows_configure_to_another_database(bcg, tmp_path):
+    assert [v.name for v in Vaccine.get_all()] == ["BCG"]
+    previous = db.DB_PATH
+
+    db.configure(path=str(tmp_path / "other.db"))
+    try:
+        assert Vaccine.get_all() == []
+    finally:
+        db.configure(path=previous)
+
+    assert [v.name for v in Vaccine.get_all()] == ["BCG"]
+
+
+def add_children(guardian, count):
+    return Child.bulk_create([(guardian.id, f"Child {i}", DOB, "female") for i in range(count)])
+
+
+def test_iter_all_streams_every_row_in_chunks(guardian):
+    children = add_children(guardian, 7)
+
+    assert [c.id for c in Child.iter_all(chunk_size=3)] == [c.id for c in children]
+
+
+def test_iterating_leaves_the_thread_free_to_write(guardian):
+    add_children(guardian, 4)
+
+    for child in Child.iter_all(chunk_size=2):
+        child.name = child.name.upper()
+        child.save()
+
+    assert [c.name for c in Child.find_by_user_id(guardian.id)] == [f"CHILD {i}" for i in range(4)]
+
+
+def test_closing_an_iterator_returns_its_connection(guardian):
+    add_children(guardian, 4)
+    pool = db.get_pool()
+
+    def checked_out():
+        return pool.stats["open"] - pool.stats["idle"]
+
+    rows = Child.iter_all(chunk_size=2)
+    next(rows)
+    assert checked_out() == 1
+    rows.close()
+
+    assert checked_out() == 0
+
+
+def test_iterators_prefetch_one_chunk_at_a_time(child, bcg):
+    polio = Vaccine.create("Polio", "Oral polio vaccine dose", 2)
+    ChildVaccine.bulk_create([(child.id, bcg.id, NEXT_WEEK), (child.id, polio.id, NEXT_WEEK)])
+
+    doses = list(ChildVaccine.iter_all(chunk_size=1, include=["vaccine"]))
+
+    assert [dose._related["vaccine"].name for dose in doses] == ["BCG", "Polio"]
+
+
+def test_keyset_pages_cover_every_row_once(guardian):
+    children = add_children(guardian, 7)
+    pages, after_id = [], 0
+
+    while True:
+        page = Child.get_page(after_id, limit=3)
+        if not page:
+            break
+        pages.append([c.id for c in page])
+        after_id = page[-1].id
+        if len(pages) == 1:
+            # Rows removed behind the cursor don't shift the later pages
+            Child.find_by_id(children[0].id).delete()
+
+    assert pages == [[c.id for c in children[:3]], [c.id for c in children[3:6]], [children[6].id]]
+
+
+def test_child_search_matches_word_prefixes(guardian):
+    other = User.create("baraka", "baraka@example.org", "password123")
+    Child.bulk_create([(guardian.id, "Emma Baker", DOB, "female"), (guardian.id, "Juma", DOB, "male"),
+                       (other.id, "Emmanuel", DOB, "male")])
+
+    assert sorted(c.name for c in Child.search("emm")) == ["Emma Baker", "Emmanuel"]
+    assert [c.name for c in Child.search("bak emm")] == ["Emma Baker"]
+    assert [c.name for c in Child.search("emm", user_id=other.id)] == ["Emmanuel"]
+    # FTS5 syntax in user input is matched as plain words
+    assert Child.search('" OR NEAR(') == [] and Child.search("  ") == []
+
+
+def test_search_index_follows_inserts_updates_and_deletes(guardian):
+    child = Child.create(guardian.id, "Zawadi", DOB, "female")
+    assert [c.id for c in Child.search("zaw")] == [child.id]
+
+    child.name = "Neema"
+    child.save()
+    assert Child.search("zaw") == []
+    assert [c.id for c in Child.search("nee")] == [child.id]
+
+    child.delete()
+    assert Child.search("nee") == []
+
+
+def test_vaccine_search_ranks_name_matches_first(database):
+    Vaccine.bulk_create([("Pentavalent", "Also covers measles antibodies", 2), ("Measles", "Measles and rubella", 9)])
+
+    assert [v.name for v in Vaccine.search("measles")] == ["Measles", "Pentavalent"]
+
+
+def table_counts():
+    with connection() as conn:
+        return [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("users", "children", "child_vaccines", "reminders")]
+
+
+@pytest.fixture
+def reminder(child, bcg):
+    dose = ChildVaccine.create(child.id, bcg.id, NEXT_WEEK)
+    return Reminder.create(dose.id, NEXT_WEEK, "BCG due today")
+
+
+def test_delete_refuses_while_dependents_exist(guardian, child, bcg, reminder):
+    with pytest.raises(ValueError):
+        guardian.delete()
+    with pytest.raises(ValueError):
+        child.delete()
+    with pytest.raises(ValueError):
+        bcg.delete()
+
+    assert table_counts() == [1, 1, 1, 1]
+
+
+def test_cascading_delete_removes_the_subtree(guardian, child, reminder):
+    other = Child.create(guardian.id, "Juma", DOB, "male")
+
+    assert child.delete(cascade=True)
+    assert table_counts() == [1, 1, 0, 0]
+
+    assert guardian.delete(cascade=True)
+    assert table_counts() == [0, 0, 0, 0]
+    assert Child.find_by_id(other.id) is None
+
+
+def test_cascading_vaccine_delete_removes_its_doses(child, bcg, reminder):
+    assert bcg.delete(cascade=True)
+
+    assert table_counts() == [1, 1, 0, 0]
+    assert Vaccine.get_all() == []
@@ -0,0 +1,98 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from lib import mailer, outbox
+from lib.db import connection
+from lib.models import Child, ChildVaccine, User, Vaccine
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def vaccines(database):
+    return Vaccine.bulk_create([
+        ("Pentavalent", "Diphtheria, tetanus, pertussis, hepatitis B and Hib", 2),
+        ("Pneumococcal", "Pneumococcal conjugate vaccine", 2),
+    ])
+
+
+def add_guardian(username, email, vaccines, children=1, language="en"):
+    user = User.create(username, email, "password123", language)
+    for i in range(children):
+        child = Child.create(user.id, f"{username.title()} Child {i}", TODAY - timedelta(days=59), "female")
+        for vaccine in vaccines:
+            ChildVaccine.create(child.id, vaccine.id, TODAY + timedelta(days=1))
+    return user
+
+
+def statuses():
+    with connection() as conn:
+        return dict(conn.execute("SELECT recipient, status FROM outbox"))
+
+
+def test_drain_sends_each_queued_email_once(vaccines, smtp_server, smtp_mailer):
+    add_guardian("amani", "amani@example.org", vaccines)
+    add_guardian("baraka", "baraka@example.org", vaccines, language="sw")
+
+    assert outbox.enqueue_due(TODAY) == 4
+    assert outbox.enqueue_due(TODAY) == 0
+    assert outbox.drain("worker", smtp_mailer) == (4, 0)
+    assert outbox.drain("worker", smtp_mailer) == (0, 0)
+
+    assert len(smtp_server.messages) == 4
+    assert outbox.pending_count() == 0
+    with connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM child_vaccines WHERE reminder_sent = 0").fetchone()[0] == 0
+    # Sent doses are not queued again
+    assert outbox.enqueue_due(TODAY) == 0
+
+
+def test_drain_over_concurrent_sessions(vaccines, smtp_server, monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_HOST", smtp_server.host)
+    monkeypatch.setattr(mailer, "SMTP_PORT", smtp_server.port)
+    monkeypatch.setattr(mailer, "SMTP_USER", "")
+    monkeypatch.setattr(mailer, "SMTP_FROM", "reminders@example.org")
+    monkeypatch.setattr(mailer, "SMTP_STARTTLS", False)
+    for i in range(3):
+        add_guardian(f"guardian{i}", f"guardian{i}@example.org", vaccines, children=2)
+
+    outbox.enqueue_due(TODAY)
+
+    assert outbox.drain("worker", concurrency=3, batch_size=5) == (12, 0)
+    assert len(smtp_server.messages) == 12
+    assert outbox.pending_count() == 0
+
+
+def test_refused_recipient_is_given_up(vaccines, smtp_mailer):
+    add_guardian("amani", "amani@example.org", vaccines[:1])
+    add_guardian("refused", "refused@example.org", vaccines[:1])
+    outbox.enqueue_due(TODAY)
+
+    assert outbox.drain("worker", smtp_mailer) == (1, 1)
+
+    assert statuses() == {"amani@example.org": "sent", "refused@example.org": "failed"}
+
+
+def test_digest_sends_one_email_per_guardian(vaccines, smtp_server, smtp_mailer):
+    add_guardian("amani", "amani@example.org", vaccines, children=2)
+    add_guardian("baraka", "baraka@example.org", vaccines[:1])
+    outbox.enqueue_due(TODAY)
+
+    assert outbox.drain("worker", smtp_mailer, digest=True) == (2, 0)
+
+    recipients = sorted(rcpts[0] for _, rcpts, _ in smtp_server.messages)
+    assert recipients == ["amani@example.org", "baraka@example.org"]
+    assert outbox.pending_count() == 0
+
+
+def test_expired_lease_is_claimed_again(vaccines):
+    add_guardian("amani", "amani@example.org", vaccines[:1])
+    outbox.enqueue_due(TODAY)
+
+    now = time.time()
+    first = outbox.claim("crashed", lease_seconds=60, now=now)
+    assert len(first) == 1
+    assert outbox.claim("other", now=now + 30) == []
+    assert outbox.claim("other", now=now + 61) == first
@@ -0,0 +1,64 @@
+import pytest
+
+from lib.models import Vaccine
+from lib.rules import compile_rules, plan_series
+
+BCG, POLIO_1, POLIO_2, MEASLES_1, MEASLES_2 = range(1, 6)
+
+
+@pytest.fixture
+def rules():
+    # Unsaved vaccines: compiling rules needs no database
+    return compile_rules([
+        Vaccine("BCG", "Protects against tuberculosis", 0, max_age_days=365, id=BCG),
+        Vaccine("Polio", "Oral polio vaccine dose", 2, min_age_days=42, max_age_days=1800, id=POLIO_1),
+        Vaccine("Polio", "Oral polio vaccine dose", 4, dose_number=2, min_age_days=70, min_interval_days=28,
+                max_age_days=1800, id=POLIO_2),
+        Vaccine("Measles", "Measles and rubella vaccine", 9, min_age_days=270, id=MEASLES_1),
+        Vaccine("Measles", "Measles and rubella vaccine", 18, dose_number=2, min_interval_days=28, id=MEASLES_2),
+    ])
+
+
+def plan(rules, age, history=None, include_missed=False):
+    return [(rule.vaccine_id, day) for rule, day in rules.plan(age, history, include_missed)]
+
+
+def test_newborn_gets_every_dose_at_its_recommended_age(rules):
+    assert plan(rules, 0) == [(BCG, 0), (POLIO_1, 60), (POLIO_2, 120), (MEASLES_1, 270), (MEASLES_2, 540)]
+
+
+def test_missed_doses_with_a_window_are_caught_up_on_the_accelerated_schedule(rules):
+    # Polio dose 2 follows the late dose 1 by its minimum interval, not at 120 days
+    assert plan(rules, 100) == [(BCG, 100), (POLIO_1, 100), (POLIO_2, 128), (MEASLES_1, 270), (MEASLES_2, 540)]
+
+
+def test_missed_doses_without_a_window_are_skipped(rules):
+    # Measles dose 2 keeps its date counted from when dose 1 was due
+    assert plan(rules, 300) == [(BCG, 300), (POLIO_1, 300), (POLIO_2, 328), (MEASLES_2, 540)]
+    assert (MEASLES_1, 270) in plan(rules, 300, include_missed=True)
+
+
+def test_doses_past_their_maximum_age_are_dropped(rules):
+    assert plan(rules, 400)[0] == (POLIO_1, 400)
+    assert plan(rules, rules.horizon + 100) == []
+
+
+def test_history_spaces_the_next_dose_from_the_one_given(rules):
+    assert plan(rules, 100, {POLIO_1: 95}) == [(BCG, 100), (POLIO_2, 123), (MEASLES_1, 270), (MEASLES_2, 540)]
+
+
+def test_plan_table_matches_planning_each_series(rules):
+    for age in range(0, rules.horizon + 2, 7):
+        planned = [pair for series in rules.series.values() for pair in plan_series(series, {}, age)]
+        assert list(rules.plan(age)) == sorted(planned, key=lambda pair: pair[1])
+
+
+def test_compiled_rules_are_reused_until_the_catalog_changes(rules):
+    vaccines = [rule.vaccine for rule in rules.rules]
+    assert compile_rules(vaccines) is rules
+
+    vaccines[0].max_age_days = 30
+    edited = compile_rules(vaccines)
+
+    assert edited is not rules and edited.key != rules.key
+    assert plan(edited, 100)[0] == (POLIO_1, 100)
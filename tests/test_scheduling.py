@@ -0,0 +1,177 @@
+from datetime import date, timedelta
+
+import pytest
+
+from lib.backfill import run_backfill
+from lib.db import connection
+from lib.models import Child, ChildVaccine, User, Vaccine
+from lib.scheduling import schedule_child, schedule_population
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def vaccines(database):
+    return Vaccine.bulk_create([
+        dict(name="BCG", description="Protects against tuberculosis", recommended_age_months=0,
+             max_age_days=365),
+        dict(name="Polio", description="Oral polio vaccine dose", recommended_age_months=2,
+             min_age_days=42),
+        dict(name="Polio", description="Oral polio vaccine dose", recommended_age_months=4, dose_number=2,
+             min_age_days=70, min_interval_days=28),
+        dict(name="Measles", description="Measles and rubella vaccine", recommended_age_months=9,
+             min_age_days=270),
+    ])
+
+
+@pytest.fixture
+def guardian(database):
+    return User.create("amani", "amani@example.org", "password123")
+
+
+def add_child(guardian, age_days, name="Zawadi"):
+    return Child.create(guardian.id, name, TODAY - timedelta(days=age_days), "female")
+
+
+def schedule_of(child):
+    """{(series, dose): (days from birth, status, reminder days from birth)} for a child."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT v.name, v.dose_number, cv.scheduled_date, cv.status, r.reminder_date
+            FROM child_vaccines cv
+            JOIN vaccines v ON v.id = cv.vaccine_id
+            LEFT JOIN reminders r ON r.child_vaccine_id = cv.id
+            WHERE cv.child_id = ?
+        """, (child.id,)).fetchall()
+    dob = child.date_of_birth
+    return {
+        (name, dose): ((scheduled - dob).days, status, None if reminder is None else (reminder - dob).days)
+        for name, dose, scheduled, status, reminder in rows
+    }
+
+
+def test_schedule_child_writes_the_missing_doses_and_their_reminders(vaccines, guardian):
+    child = add_child(guardian, 10)
+
+    created = schedule_child(child)
+
+    assert len(created) == 4
+    assert schedule_of(child) == {
+        # Past its recommended age but still in its window: caught up today,
+        # too late for a reminder
+        ("BCG", 1): (10, "scheduled", None),
+        ("Polio", 1): (60, "scheduled", 53),
+        ("Polio", 2): (120, "scheduled", 113),
+        ("Measles", 1): (270, "scheduled", 263),
+    }
+
+
+def test_schedule_child_leaves_existing_doses_alone(vaccines, guardian):
+    child = add_child(guardian, 10)
+    ChildVaccine.create(child.id, vaccines[0].id, TODAY + timedelta(days=2))
+
+    schedule_child(child)
+
+    assert schedule_of(child)[("BCG", 1)] == (12, "scheduled", None)
+    assert len(schedule_of(child)) == 4
+    assert schedule_child(child) == []
+
+
+AGES = [0, 10, 50, 100, 300, 400, 800]
+
+
+def test_schedule_population_matches_schedule_child(vaccines, guardian):
+    by_child = [add_child(guardian, age, f"Child {age}") for age in AGES]
+    by_population = [add_child(guardian, age, f"Child {age}") for age in AGES]
+    # Doses already on record are kept and count towards the series
+    for child in (by_child[3], by_population[3]):
+        ChildVaccine.create(child.id, vaccines[1].id, TODAY + timedelta(days=1))
+
+    created = [schedule_child(child) for child in by_child]
+    chunks = []
+    totals = schedule_population(chunk_size=3, progress=lambda *chunk: chunks.append(chunk))
+
+    assert [schedule_of(child) for child in by_population] == [schedule_of(child) for child in by_child]
+    assert totals[0] == sum(len(doses) for doses in created)
+    assert totals == tuple(map(sum, zip(*(chunk[1:] for chunk in chunks))))
+    assert [chunk[0] for chunk in chunks] == [by_child[2].id, by_child[5].id, by_population[1].id,
+                                              by_population[4].id, by_population[6].id]
+    assert schedule_population() == (0, 0)
+
+
+def test_interrupted_backfill_resumes_after_its_last_checkpoint(vaccines, guardian):
+    children = [add_child(guardian, age, f"Child {age}") for age in AGES]
+    saved = []
+
+    def interrupt(low_id, high_id, schedules, reminders):
+        saved.append((low_id, high_id, schedules))
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        run_backfill("test-run", workers=1, chunk_size=3, progress=interrupt)
+    assert [(low, high) for low, high, _ in saved] == [(0, 3)]
+
+    resumed = []
+    totals = run_backfill("test-run", workers=1, chunk_size=3,
+                          progress=lambda low_id, high_id, *counts: resumed.append((low_id, high_id)))
+
+    assert resumed == [(3, 6), (6, 9)]
+    assert saved[0][2] + totals[0] == sum(len(schedule_of(child)) for child in children)
+    assert [schedule_of(child) for child in children][:3] == [
+        {("BCG", 1): (age, "scheduled", None), ("Polio", 1): (60, "scheduled", 53),
+         ("Polio", 2): (120, "scheduled", 113), ("Measles", 1): (270, "scheduled", 263)}
+        for age in AGES[:3]
+    ]
+    assert run_backfill("test-run", workers=1, chunk_size=3) == (0, 0)
+
+
+def test_corrected_date_of_birth_moves_the_schedule(vaccines, guardian):
+    child = add_child(guardian, 10)
+    schedule_child(child)
+
+    child.date_of_birth = TODAY - timedelta(days=60)
+    child.save()
+
+    assert schedule_of(child) == {
+        # Still caught up today
+        ("BCG", 1): (60, "scheduled", None),
+        # Due today now: its reminder would be in the past, so it is dropped
+        ("Polio", 1): (60, "scheduled", None),
+        ("Polio", 2): (120, "scheduled", 113),
+        ("Measles", 1): (270, "scheduled", 263),
+    }
+    with connection() as conn:
+        message = conn.execute("SELECT message FROM reminders r JOIN child_vaccines cv ON cv.id = r.child_vaccine_id"
+                               " WHERE cv.vaccine_id = ?", (vaccines[2].id,)).fetchone()[0]
+    assert (TODAY + timedelta(days=60)).isoformat() in message
+    assert child.last_reschedule == {"moved": 3, "reminders": 2, "added": 0}
+
+
+def test_vaccine_edit_reschedules_its_series(vaccines, guardian):
+    scheduled = add_child(guardian, 10, "Scheduled")
+    schedule_child(scheduled)
+    unscheduled = add_child(guardian, 10, "Unscheduled")
+
+    polio = Vaccine.find_by_id(vaccines[2].id)
+    polio.recommended_age_months = 5
+    polio.save()
+
+    assert schedule_of(scheduled)[("Polio", 2)] == (150, "scheduled", 143)
+    assert schedule_of(scheduled)[("BCG", 1)] == (10, "scheduled", None)
+    # Only the edited series is added for children without any of it
+    assert schedule_of(unscheduled) == {("Polio", 1): (60, "scheduled", 53), ("Polio", 2): (150, "scheduled", 143)}
+    assert polio.last_reschedule == {"moved": 1, "reminders": 1, "added": 2}
+
+
+def test_renaming_a_vaccine_reschedules_both_series(vaccines, guardian):
+    child = add_child(guardian, 10)
+    schedule_child(child)
+
+    # Polio dose 2 becomes the only dose of its own series
+    polio = Vaccine.find_by_id(vaccines[2].id)
+    polio.name = "IPV"
+    polio.dose_number = 1
+    polio.save()
+
+    assert schedule_of(child)[("IPV", 1)] == (120, "scheduled", 113)
+    assert polio.last_reschedule["moved"] == 0
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import pytest
+
+from lib import db
+from lib.db import connection
+from lib.models import Child, ChildVaccine, User, Vaccine
+from lib.sweeper import sweep_overdue
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def doses(database):
+    user = User.create("amani", "amani@example.org", "password123")
+    child = Child.create(user.id, "Zawadi", TODAY - timedelta(days=90), "female")
+    vaccines = Vaccine.bulk_create([
+        ("BCG", "Protects against tuberculosis", 0),
+        ("Polio", "Oral polio vaccine dose", 2),
+        ("Measles", "Measles and rubella vaccine", 9),
+    ])
+    with connection() as conn:
+        # Past dates can't be scheduled through the model
+        conn.executemany(
+            "INSERT INTO child_vaccines (child_id, vaccine_id, scheduled_date) VALUES (?, ?, ?)",
+            [(child.id, vaccines[0].id, TODAY - timedelta(days=90)), (child.id, vaccines[1].id, TODAY - timedelta(days=1))],
+        )
+    ChildVaccine.create(child.id, vaccines[2].id, TODAY + timedelta(days=180))
+    return vaccines
+
+
+def statuses():
+    with connection() as conn:
+        return [row[0] for row in conn.execute("SELECT status FROM child_vaccines ORDER BY vaccine_id")]
+
+
+def test_sweep_marks_past_doses_overdue(doses):
+    assert sweep_overdue() == {doses[0].id: 1, doses[1].id: 1}
+
+    assert statuses() == ["overdue", "overdue", "scheduled"]
+
+
+def test_later_sweeps_only_look_at_newly_due_doses(doses):
+    sweep_overdue(TODAY - timedelta(days=30))
+
+    assert sweep_overdue() == {doses[1].id: 1}
+    assert sweep_overdue(TODAY + timedelta(days=181)) == {doses[2].id: 1}
+
+
+def test_repeat_sweep_on_the_same_day_skips_the_write_lock(doses):
+    sweep_overdue()
+    writer = db.connect(db.DB_PATH)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        assert sweep_overdue() == {}
+    finally:
+        writer.rollback()
+        writer.close()
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+
+import pytest
+
+from lib import templates
+from lib.templates import LANGUAGES, render, sql_render, template
+
+VALUES = {"child": "Zawadi", "vaccine": "BCG", "date": "2026-01-10"}
+
+
+@pytest.fixture
+def locales(tmp_path, monkeypatch):
+    """Point the templates at a locales directory written by the test."""
+    def write(language, texts):
+        (tmp_path / f"{language}.json").write_text(json.dumps(texts), encoding="utf-8")
+        monkeypatch.setattr(templates, "LANGUAGES", tuple(sorted(p.stem for p in tmp_path.glob("*.json"))))
+
+    monkeypatch.setattr(templates, "LOCALES_DIR", str(tmp_path))
+    monkeypatch.setattr(templates, "_catalogs", {})
+    write("en", {"reminder": "Reminder: {child} is due for {vaccine} on {date}", "footer": "Bring the card"})
+    return write
+
+
+def test_templates_render_in_each_language():
+    assert render("reminder", "en", **VALUES) == "Reminder: Zawadi is due for BCG on 2026-01-10"
+    assert render("reminder", "sw", **VALUES) == "Kikumbusho: Zawadi anatakiwa kupata chanjo ya BCG tarehe 2026-01-10"
+
+
+def test_unsupported_languages_fall_back_to_english():
+    assert render("reminder", "fr", **VALUES) == render("reminder", "en", **VALUES)
+
+
+def test_templates_a_language_leaves_out_fall_back_to_english(locales):
+    locales("xx", {"reminder": "{child}: {vaccine} ({date})"})
+
+    assert render("reminder", "xx", **VALUES) == "Zawadi: BCG (2026-01-10)"
+    assert render("footer", "xx") == "Bring the card"
+
+
+@pytest.mark.parametrize("text", ["{kid} is due", "{count} doses", "due on {date:%d/%m}", "{vaccine!r}"])
+def test_unknown_placeholders_fail_on_load(locales, text):
+    locales("xx", {"reminder": text})
+
+    with pytest.raises(ValueError, match="placeholder"):
+        template("reminder", "xx")
+
+
+def test_unknown_templates_fail_on_load(locales):
+    locales("xx", {"reminders": "{child}"})
+
+    with pytest.raises(ValueError, match="reminders"):
+        template("reminder", "xx")
+
+
+@pytest.mark.parametrize("language", LANGUAGES + ("fr",))
+def test_sql_render_matches_render(language):
+    conn = sqlite3.connect(":memory:")
+    sql = sql_render("reminder", "language", child="child", vaccine="vaccine", date="date")
+
+    rendered = conn.execute(f"SELECT {sql} FROM (SELECT ? AS language, ? AS child, ? AS vaccine, ? AS date)",
+                            (language, "Amani O'Neil", "BCG", "2026-01-10")).fetchone()[0]
+
+    assert rendered == render("reminder", language, **dict(VALUES, child="Amani O'Neil"))
+
+
+def test_sql_literals_are_quoted():
+    conn = sqlite3.connect(":memory:")
+
+    # The English footer contains an apostrophe
+    assert conn.execute(f"SELECT {template('footer').sql()}").fetchone()[0] == render("footer")